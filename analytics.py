@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import glob
+import json
+import argparse
+
+try:
+    import numpy as np
+except ImportError:   # NumPy is optional, only this module needs it
+    np = None
+
+from batch import iter_matched_verses
+from lengths import DEFAULT_LENGTH_DICTIONARY, open_length_dictionary
+
+DEFAULT_PATHS = sorted(glob.glob("perseus_corpus/*"))
+
+# feet of hexameter as codes in the arrays: the index in FEET
+FEET = ("-uu", "--", "-u", "-o")
+DACTYL, SPONDEE = 0, 1
+SYLLABLE_COUNTS = (3, 2, 2, 2)   # of each foot
+FOOT_COUNT = 6
+
+# the fifth foot of HEXAMETER is always a dactyl, so verses which cannot
+# be scanned with it are scanned again with a spondaic fifth foot
+SPONDAIC_HEXAMETER = "-w | -w | -w | -w | -- | -o"
+
+
+def check_numpy():
+    if np is None:
+        raise ImportError("analytics.py needs NumPy (pip install numpy)")
+
+def encode_sequences(full_sequences):
+    """Returns the full metrical sequences of hexameters
+    (e.g. "-uu|--|--|-uu|-uu|-o") as an array of foot codes
+    (verses × feet, uint8)."""
+    check_numpy()
+    codes = {foot: code for code, foot in enumerate(FEET)}
+    feet = np.empty((len(full_sequences), FOOT_COUNT), dtype=np.uint8)
+    for i, sequence in enumerate(full_sequences):
+        feet[i] = [codes[foot] for foot in sequence.split("|")]
+    return feet
+
+def read_sequences(path, length_dictionary=None):
+    """Returns the full metrical sequences of the verses in the file which
+    can be scanned unambiguously (with a spondaic fifth foot, if they
+    cannot be scanned as a usual hexameter)."""
+    with open(path, "r") as file:
+        # skip empty lines or too short lines (with verse numbers)
+        lines = [line for line in file if len(line) >= 10]
+    # schemes of the verses are matched in batches (see batch.py)
+    sequences = []   # None if the verse is not scanned unambiguously
+    unscannable = []   # indices of verses to scan again
+    for i, verse in enumerate(iter_matched_verses(
+            lines, length_dictionary=length_dictionary)):
+        sequences.append(verse.full_metrical_sequences[0]
+                         if verse.scansion_count == 1 else None)
+        if verse.scansion_count == 0:
+            unscannable.append(i)
+    for i, verse in zip(unscannable, iter_matched_verses(
+            [lines[i] for i in unscannable],
+            length_dictionary=length_dictionary, meter=SPONDAIC_HEXAMETER)):
+        if verse.scansion_count == 1:
+            sequences[i] = verse.full_metrical_sequences[0]
+    return [sequence for sequence in sequences if sequence is not None]
+
+def analyse_feet(feet):
+    """Returns statistics of the verses given as an array of foot codes
+    (see encode_sequences)."""
+    check_numpy()
+    verse_count = len(feet)
+    spondees = feet[:, :5] == SPONDEE
+    # patterns of the first four feet, e.g. DDSS, as 4-bit numbers
+    # (spondee = 1, the first foot is the highest bit)
+    pattern_numbers = spondees[:, :4] @ (1 << np.arange(3, -1, -1))
+    pattern_counts = np.bincount(pattern_numbers, minlength=16)
+    patterns = {
+        "".join("S" if number >> (3-foot) & 1 else "D"
+                for foot in range(4)): int(count)
+        for number, count in enumerate(pattern_counts)
+        }
+    syllables = np.array(SYLLABLE_COUNTS)[feet].sum(axis=1)
+    syllable_counts = np.bincount(syllables)
+    last_feet = np.bincount(feet[:, 5], minlength=len(FEET))
+    return {
+        "verses": verse_count,
+        "dactyls": [int(count) for count
+                    in (feet[:, :5] == DACTYL).sum(axis=0)],
+        "spondees": [int(count) for count in spondees.sum(axis=0)],
+        "last_foot": {FEET[code]: int(count) for code, count
+                      in enumerate(last_feet) if count},
+        "patterns": dict(sorted(patterns.items(),
+                                key=lambda item: -item[1])),
+        "spondaic_fifth": int(spondees[:, 4].sum()),
+        "syllables": {count: int(verses) for count, verses
+                      in enumerate(syllable_counts) if verses},
+        }
+
+def get_author(path):
+    # files of the corpus are named author__work__language.json.txt
+    return os.path.basename(path).split("__")[0]
+
+def analyse_corpus(paths, length_dictionary=None, by="file"):
+    """Returns name -> statistics (see analyse_feet) of each file (by="file")
+    or author (by="author"), and of all of them ("TOTAL")."""
+    check_numpy()
+    groups = {}
+    for path in paths:
+        name = (os.path.basename(path) if by == "file"
+                else get_author(path))
+        groups.setdefault(name, []).append(
+            encode_sequences(read_sequences(path, length_dictionary)))
+    statistics = {name: analyse_feet(np.concatenate(arrays))
+                  for name, arrays in groups.items()}
+    statistics["TOTAL"] = analyse_feet(np.concatenate(
+        [array for arrays in groups.values() for array in arrays]))
+    return statistics
+
+def percent(count, total):
+    return f"{count*100 / total:.1f} %" if total else "-"
+
+def print_statistics(name, statistics, pattern_count=5, file=sys.stdout):
+    """Prints the statistics as tables."""
+    verse_count = statistics["verses"]
+    print(f"{name}\nUNAMBIGUOUS VERSES: {verse_count}\n", file=file)
+    print("foot\t| D\tS\t| D\tS", file=file)
+    for foot, (dactyls, spondees) in enumerate(zip(statistics["dactyls"],
+                                                   statistics["spondees"])):
+        print(f"{foot+1}\t| {dactyls}\t{spondees}"
+              f"\t| {percent(dactyls, verse_count)}"
+              f"\t{percent(spondees, verse_count)}", file=file)
+    last_foot = ", ".join(f"{foot} {count}" for foot, count
+                          in statistics["last_foot"].items())
+    print(f"6\t| {last_foot}", file=file)
+    print(f"\nspondaic fifth foot: {statistics['spondaic_fifth']}"
+          f" ({percent(statistics['spondaic_fifth'], verse_count)})",
+          file=file)
+    print(f"\nfirst four feet (the {pattern_count} most frequent):",
+          file=file)
+    for pattern, count in list(statistics["patterns"].items())[
+            :pattern_count]:
+        print(f"{pattern}\t| {count}\t{percent(count, verse_count)}",
+              file=file)
+    print("\nsyllables\t| verses", file=file)
+    for syllables, count in statistics["syllables"].items():
+        print(f"{syllables}\t\t| {count}\t{percent(count, verse_count)}",
+              file=file)
+    print(f"\n{'='*30}\n", file=file)
+    return
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(
+        description="Statistics of feet of unambiguously scanned"
+                    " hexameters: dactyls and spondees in each foot,"
+                    " patterns of the first four feet (e.g. DDSS), spondaic"
+                    " fifth feet, and numbers of syllables.")
+    argparser.add_argument("paths", nargs="*",
+                           help="files with verses (default:"
+                                " perseus_corpus/*)")
+    argparser.add_argument("--by", choices=("file", "author"),
+                           help="statistics of each file (default),"
+                                " or of each author",
+                           default="file")
+    argparser.add_argument("--nolengths",
+                           help="don't try to add unambiguous lengths",
+                           action="store_true")
+    argparser.add_argument("-d", "--dictionary",
+                           help=("length dictionary;"
+                                 f" default: {DEFAULT_LENGTH_DICTIONARY}"),
+                           default=DEFAULT_LENGTH_DICTIONARY)
+    argparser.add_argument("--patterns",
+                           help=("number of the most frequent patterns"
+                                 " to print (default: 5)"),
+                           type=int, default=5)
+    argparser.add_argument("-o", "--output",
+                           help="save the statistics as JSON to this file")
+    args = argparser.parse_args()
+
+    if np is None:
+        print("ERROR: analytics.py needs NumPy (pip install numpy)")
+        sys.exit(1)
+    length_dictionary = None
+    if not args.nolengths:
+        length_dictionary = open_length_dictionary(args.dictionary)
+    statistics = analyse_corpus(args.paths or DEFAULT_PATHS,
+                                length_dictionary, args.by)
+    for name, group_statistics in statistics.items():
+        print_statistics(name, group_statistics, args.patterns)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(statistics, file, indent=2, ensure_ascii=False)
@@ -1,10 +1,28 @@
 #!/usr/bin/env python3
 
 import sys
+
+if __name__ == "__main__" and "--client" in sys.argv[1:]:
+    # the client only forwards the arguments and input to the daemon,
+    # so it does not import the scanner (nor anything else)
+    from daemon import run_client
+    sys.exit(run_client(sys.argv[1:]))
+
+import os
+import io
+import json
 import argparse
+import cProfile
+import itertools
+import multiprocessing
 
-from scan import Verse
-from lengths import LengthDictionary
+from scan import (METERS, COUPLETS, SCHEME_CACHE, assign_meters, get_meter,
+                  scan_line, format_scansions)
+from lengths import DEFAULT_LENGTH_DICTIONARY, open_length_dictionary
+from profiling import start_profiling, stop_profiling
+from result_cache import (DEFAULT_RESULT_CACHE, DEFAULT_MAX_ENTRIES,
+                          ResultCache)
+from daemon import DEFAULT_SOCKET, DEFAULT_IDLE_TIMEOUT, run_daemon
 
 argparser = argparse.ArgumentParser()
 argparser.add_argument("-i", "--input",
@@ -23,37 +41,302 @@ argparser.add_argument("--nolengths",
                         "don't try to add unambiguous lengths"
                         ),
                     action="store_true")
-args = argparser.parse_args()
+argparser.add_argument("-d", "--dictionary",
+                    help=(
+                        "length dictionary, binary or pickled"
+                        " (see lengths.py convert);"
+                        f" default: {DEFAULT_LENGTH_DICTIONARY}"
+                        ),
+                    default=DEFAULT_LENGTH_DICTIONARY)
+argparser.add_argument("-m", "--meter",
+                    help=(
+                        "meter of the verses: name of a registered meter"
+                        f" ({', '.join(METERS)}), a scheme (e.g."
+                        " \"-w | -w | -w | -w | -uu | -o\"),"
+                        f" couplets ({', '.join(COUPLETS)}),"
+                        " or auto (try all registered meters);"
+                        " default: hexameter"
+                        ),
+                    default="hexameter")
+argparser.add_argument("--cache-size",
+                    help=(
+                        "maximal number of verse schemes whose scansions"
+                        " are cached (0 disables the cache);"
+                        f" default: {SCHEME_CACHE.maxsize}"
+                        ),
+                    type=int, default=SCHEME_CACHE.maxsize)
+argparser.add_argument("-j", "--jobs",
+                    help=(
+                        "number of processes scanning in parallel"
+                        " (default: 1, i. e. scan in this process)"
+                        ),
+                    type=int, default=1)
+argparser.add_argument("--chunk-size",
+                    help=(
+                        "number of lines sent to a process at once"
+                        " (only with --jobs; default: 200)"
+                        ),
+                    type=int, default=200)
+argparser.add_argument("-f", "--format",
+                    help=(
+                        "output format: text (default), or jsonl"
+                        " (one JSON object with the results per line)"
+                        ),
+                    choices=("text", "jsonl"), default="text")
+argparser.add_argument("--profile",
+                    help=(
+                        "print time spent in each stage of scanning and"
+                        " the N slowest lines to stderr (default N: 10)"
+                        ),
+                    type=int, nargs="?", const=10, default=0, metavar="N")
+argparser.add_argument("--cprofile",
+                    help=(
+                        "save cProfile statistics of the whole run to"
+                        " this file (only without --jobs)"
+                        ),
+                    metavar="PATH")
+argparser.add_argument("--result-cache",
+                    help=(
+                        "keep results in this SQLite database and take"
+                        " them from it when the same lines are scanned"
+                        " again with the same options and dictionary;"
+                        f" default (without PATH): {DEFAULT_RESULT_CACHE}"
+                        ),
+                    nargs="?", const=DEFAULT_RESULT_CACHE, metavar="PATH")
+argparser.add_argument("--result-cache-size",
+                    help=(
+                        "maximal number of results in the result cache"
+                        " (the least recently used are removed);"
+                        f" default: {DEFAULT_MAX_ENTRIES}"
+                        ),
+                    type=int, default=DEFAULT_MAX_ENTRIES, metavar="N")
+argparser.add_argument("--daemon",
+                    help=(
+                        "keep running in the background with the length"
+                        " dictionary loaded, and scan for clients"
+                        " (see --client) on the Unix socket"
+                        ),
+                    action="store_true")
+argparser.add_argument("--client",
+                    help=(
+                        "let the daemon scan (with all the other"
+                        " arguments), start it if it is not running"
+                        ),
+                    action="store_true")
+argparser.add_argument("--socket",
+                    help=(
+                        "Unix socket of the daemon;"
+                        f" default: {DEFAULT_SOCKET}"
+                        ),
+                    default=DEFAULT_SOCKET, metavar="PATH")
+argparser.add_argument("--idle-timeout",
+                    help=(
+                        "seconds after which an idle daemon stops;"
+                        f" default: {DEFAULT_IDLE_TIMEOUT}"
+                        ),
+                    type=float, default=DEFAULT_IDLE_TIMEOUT,
+                    metavar="SECONDS")
 
-input_file = args.input
-unmarked_short = args.brevize
 
+def format_result(result, output_format):
+    """Returns the output for a ScanResult and the warning for stderr
+    (or None)."""
+    if output_format == "jsonl":
+        # the line as read, without its newline
+        result = result._replace(line=result.line.rstrip("\n"))
+        return json.dumps(result._asdict(), ensure_ascii=False)+"\n", None
+    text, warning = format_scansions(result)
+    return text+"\n", warning
 
-if not args.nolengths:
-    default_ld = LengthDictionary()
-    try:
-        default_ld.load(".default_length_dictionary.pickle")
-        length_dictionary=default_ld.dictionary
-    except FileNotFoundError:
-        print("WARNING: length dictionary not found, cannot add lengths")
-        length_dictionary=None
-else:
-    length_dictionary=None
-
-if input_file:
+def scan_lines(lines, length_dictionary, unmarked_short,
+               output_format="text", stdout=sys.stdout, stderr=sys.stderr,
+               result_cache=None):
+    """Writes scansions of (line, meter) pairs (taking the results from
+    the ResultCache, if given, where it has them)."""
+    if result_cache is None:
+        results = (scan_line(line, length_dictionary, unmarked_short, meter)
+                   for line, meter in lines)
+    else:
+        results = result_cache.scan_pairs(lines, length_dictionary,
+                                          unmarked_short)
+    for result in results:
+        text, warning = format_result(result, output_format)
+        if warning:
+            stderr.write(warning+"\n")
+        stdout.write(text)
+    return
+
+
+# length dictionaries already loaded (by the daemon, for other
+# requests): (path, modification time) -> dictionary
+_length_dictionaries = {}
+
+def load_length_dictionary(path):
+    key = (os.path.realpath(path), os.stat(path).st_mtime_ns)
+    if key not in _length_dictionaries:
+        _length_dictionaries[key] = open_length_dictionary(path)
+    return _length_dictionaries[key]
+
+
+# parallel scanning
+# -----------------
+
+# length dictionary and options of a worker process (each worker
+# loads the dictionary once when it starts)
+_worker_options = None
+_worker_result_cache = None
+_worker_profile = 0   # number of the slowest lines to profile
+
+def init_worker(dictionary_path, unmarked_short, cache_size,
+                output_format, profile, result_cache_path=None,
+                result_cache_size=DEFAULT_MAX_ENTRIES):
+    global _worker_options, _worker_profile, _worker_result_cache
+    _worker_profile = profile
+    SCHEME_CACHE.resize(cache_size)
+    if dictionary_path is None:
+        length_dictionary = None
+    else:
+        length_dictionary = open_length_dictionary(dictionary_path)
+    _worker_options = (length_dictionary, unmarked_short, output_format)
+    if result_cache_path is not None:
+        _worker_result_cache = ResultCache(result_cache_path,
+                                           result_cache_size)
+
+# the output of the chunk is returned instead of printed, so that
+# the main process can print the chunks in the original order
+# (and so is the profile, if profiling is on)
+def scan_chunk(chunk):
+    stdout, stderr = io.StringIO(), io.StringIO()
+    profiler = start_profiling(_worker_profile) if _worker_profile else None
     try:
-        with open(input_file, "r") as file:
-            for line in file:
-                verse = Verse(line, length_dictionary=length_dictionary,
-                              unmarked_short=unmarked_short)
-                verse.print_scansions()
-                print()
-    except FileNotFoundError:
-        print("ERROR: file {input_file!r} not found")
-
-else:
-    for line in sys.stdin:
-        verse = Verse(line, length_dictionary=length_dictionary,
-                      unmarked_short=unmarked_short)
-        verse.print_scansions()
-        print()
+        scan_lines(chunk, *_worker_options, stdout=stdout, stderr=stderr,
+                   result_cache=_worker_result_cache)
+    finally:
+        if profiler is not None:
+            stop_profiling()
+    return stdout.getvalue(), stderr.getvalue(), profiler
+
+def scan_lines_parallel(lines, jobs, chunk_size, dictionary_path,
+                        unmarked_short, cache_size, output_format="text",
+                        profiler=None, result_cache_path=None,
+                        result_cache_size=DEFAULT_MAX_ENTRIES):
+    """Prints scansions of (line, meter) pairs like scan_lines, but
+    chunks of lines are scanned by a pool of jobs processes. Profiles
+    of the chunks are merged into the profiler (if given). Each process
+    opens the result cache at result_cache_path (if given) itself."""
+    chunks = iter(lambda: list(itertools.islice(lines, chunk_size)), [])
+    profile = profiler.slowest_count if profiler is not None else 0
+    with multiprocessing.Pool(jobs, initializer=init_worker,
+                              initargs=(dictionary_path, unmarked_short,
+                                        cache_size, output_format,
+                                        profile, result_cache_path,
+                                        result_cache_size)) as pool:
+        for stdout, stderr, chunk_profiler in pool.imap(scan_chunk, chunks):
+            # not the defaults, the daemon replaces them for each client
+            sys.stdout.write(stdout)
+            sys.stderr.write(stderr)
+            if chunk_profiler is not None:
+                profiler.merge(chunk_profiler)
+    return
+
+
+def main(argv=None):
+    """Runs app.py with the arguments (default: sys.argv), reading
+    sys.stdin and writing to sys.stdout and sys.stderr (which the daemon
+    replaces for each client)."""
+    args = argparser.parse_args(argv)
+
+    if args.daemon:
+        # the default dictionary is loaded right away
+        if os.path.exists(args.dictionary):
+            load_length_dictionary(args.dictionary)
+        try:
+            run_daemon(main, args.socket, args.idle_timeout)
+        except ConnectionError as error:
+            print(f"ERROR: {error}", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    SCHEME_CACHE.resize(args.cache_size)
+
+    if args.meter != "auto" and args.meter not in COUPLETS:
+        try:
+            get_meter(args.meter)
+        except ValueError as error:
+            argparser.error(str(error))
+    if args.jobs < 1:
+        argparser.error("--jobs must be at least 1")
+    if args.chunk_size < 1:
+        argparser.error("--chunk-size must be at least 1")
+    if args.cprofile and args.jobs != 1:
+        argparser.error("--cprofile cannot be used with --jobs")
+    if args.result_cache_size < 1:
+        argparser.error("--result-cache-size must be at least 1")
+
+    input_file = args.input
+    unmarked_short = args.brevize
+
+    dictionary_path = None
+    length_dictionary = None
+    if not args.nolengths:
+        if not os.path.exists(args.dictionary):
+            print("WARNING: length dictionary not found, cannot add lengths")
+        elif args.jobs == 1:
+            length_dictionary = load_length_dictionary(args.dictionary)
+        else:   # the workers load it themselves
+            dictionary_path = args.dictionary
+
+    def scan(lines):
+        lines = assign_meters(lines, args.meter)
+        profiler = None
+        if args.profile:
+            profiler = start_profiling(args.profile)
+        if args.cprofile:
+            cprofiler = cProfile.Profile()
+            cprofiler.enable()
+        # the profilers are stopped even if scanning fails, the daemon
+        # goes on serving other clients
+        try:
+            if args.jobs == 1:
+                result_cache = None
+                if args.result_cache:
+                    result_cache = ResultCache(args.result_cache,
+                                               args.result_cache_size)
+                scan_lines(lines, length_dictionary, unmarked_short,
+                           args.format, sys.stdout, sys.stderr,
+                           result_cache)
+                if result_cache is not None:
+                    result_cache.close()
+            else:
+                scan_lines_parallel(lines, args.jobs, args.chunk_size,
+                                    dictionary_path, unmarked_short,
+                                    args.cache_size, args.format, profiler,
+                                    args.result_cache,
+                                    args.result_cache_size)
+        finally:
+            if args.cprofile:
+                cprofiler.disable()
+            if profiler is not None:
+                stop_profiling()
+        if args.cprofile:
+            cprofiler.dump_stats(args.cprofile)
+        if profiler is not None:
+            sys.stdout.flush()
+            profiler.print_summary(sys.stderr)
+
+    if input_file:
+        # only a missing input file is reported so, not errors of scanning
+        try:
+            file = open(input_file, "r")
+        except FileNotFoundError:
+            print(f"ERROR: file {input_file!r} not found", file=sys.stderr)
+            sys.exit(1)
+        with file:
+            scan(file)
+    else:
+        scan(sys.stdin)
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+# matching schemes of many verses against a meter at once (vectorized
+# with NumPy); Verse matches its scheme on its own when it is needed,
+# but bulk jobs can first run the verses up to make_scheme and then
+# match all their schemes in one go (match_verses)
+
+import sys
+import glob
+import time
+import argparse
+
+try:
+    import numpy as np
+except ImportError:   # NumPy is optional, without it match_verses
+    np = None         # matches the verses one by one
+
+from scan import (Verse, HEXAMETER, SCHEME_CACHE, get_meter,
+                  get_meter_group, make_match_result)
+
+# syllables are stored as bits of one number
+MAX_SYLLABLES = 64
+BATCH_SIZE = 1024   # verses matched at once by bulk jobs
+
+
+def check_numpy():
+    if np is None:
+        raise ImportError("batch.py needs NumPy (pip install numpy)")
+
+def encode_schemes(schemes):
+    """Returns the schemes (strings of "-", "u", "o", or of "-" and "u"
+    only) as a padded array of their characters (schemes × syllables,
+    uint8; longer schemes are cut to MAX_SYLLABLES) and an array of
+    their lengths."""
+    check_numpy()
+    lengths = np.array([len(scheme) for scheme in schemes], dtype=np.int64)
+    width = min(int(lengths.max(initial=0)), MAX_SYLLABLES)
+    padded = "".join(scheme[:width].ljust(width) for scheme in schemes)
+    chars = np.frombuffer(padded.encode("ascii"), dtype=np.uint8)
+    return chars.reshape(len(schemes), width), lengths
+
+def get_bits(chars, char):
+    """Returns a number for each row of the array of characters (see
+    encode_schemes) with bit i set if its i-th character is char."""
+    # bytes of the bits, the first syllable is the lowest bit
+    packed = np.packbits(chars == ord(char), axis=1, bitorder="little")
+    padded = np.zeros((len(chars), MAX_SYLLABLES // 8), dtype=np.uint8)
+    padded[:, :packed.shape[1]] = packed
+    return padded.view("<u8")[:, 0]
+
+
+class EncodedMeter():
+    """Realizations of a meter (Meter.sequences) as arrays:
+    .lengths: number of syllables of each of them
+    .long_bits: bit i is set if the i-th syllable is long
+    .match: finds realizations fitting the schemes of many verses"""
+
+    def __init__(self, meter):
+        check_numpy()
+        self.meter = meter
+        self.sequences = list(meter.sequences)   # syllable lengths
+        self.full_sequences = list(meter.sequences.values())
+        if max(len(sequence) for sequence in self.sequences) > MAX_SYLLABLES:
+            raise ValueError(f"Meter {meter.name!r} has more than"
+                             f" {MAX_SYLLABLES} syllables")
+        chars, self.lengths = encode_schemes(self.sequences)
+        self.long_bits = get_bits(chars, "-")
+
+    def match(self, schemes):
+        """Returns a boolean array (schemes × realizations): whether
+        the realization fits the scheme ("o" fits both "-" and "u")."""
+        chars, lengths = encode_schemes(schemes)
+        # syllables whose length is known, and which of them are long
+        known_bits = get_bits(chars, "-") | get_bits(chars, "u")
+        long_bits = get_bits(chars, "-")
+        return (
+            (lengths[:, None] == self.lengths[None, :]) &
+            ((long_bits[:, None] ^ self.long_bits[None, :])
+             & known_bits[:, None] == 0)
+            )
+
+    def get_sequences(self, indices):
+        """Returns the realizations with the indices as Meter.match
+        does."""
+        return {self.sequences[i]: self.full_sequences[i] for i in indices}
+
+
+# each meter is encoded only once
+_encoded_meters = {}
+
+def encode_meter(meter):
+    meter = get_meter(meter)
+    if meter not in _encoded_meters:
+        _encoded_meters[meter] = EncodedMeter(meter)
+    return _encoded_meters[meter]
+
+def match_schemes(schemes, meter="hexameter"):
+    """Returns for each scheme the indices of the realizations of
+    the meter (in Meter.sequences) fitting it, in their order."""
+    if not schemes:
+        return []
+    matches = encode_meter(meter).match(schemes)
+    rows, columns = np.nonzero(matches)
+    return np.split(columns, np.searchsorted(rows,
+                                             np.arange(1, len(schemes))))
+
+def match_schemes_with_group(schemes, meter_group):
+    """Returns for each scheme (meter, realizations) of the first meter
+    of the group with at least one realization fitting the scheme
+    (see MeterGroup.match), or None if there is no such meter."""
+    results = [None]*len(schemes)
+    for meter in meter_group.meters:
+        unmatched = [i for i, result in enumerate(results) if result is None]
+        if not unmatched:
+            break
+        encoded = encode_meter(meter)
+        for i, indices in zip(unmatched, match_schemes(
+                [schemes[i] for i in unmatched], meter)):
+            if len(indices):
+                results[i] = (meter, encoded.get_sequences(indices))
+    return results
+
+def match_verses(verses):
+    """Matches the schemes of the verses (made by Verse, which
+    postpones matching) all at once, with the same results as
+    Verse.match_metrical_sequences. Schemes are matched only once for
+    all verses which have them, and results are taken from and added
+    to SCHEME_CACHE. Without NumPy, the verses are matched one by
+    one."""
+    verses = [verse for verse in verses
+              if verse.matching_pending and not verse.enumerate_candidates]
+    if np is None:
+        for verse in verses:
+            verse.run_matching()
+        return
+    results = {}
+    pending = {}   # meter or meter group -> keys of unknown results
+    for verse in verses:
+        key = verse.get_scheme_key()
+        if key in results or key in pending.get(key[1], ()):
+            continue
+        result = SCHEME_CACHE.get(key)
+        if result is None:
+            pending.setdefault(key[1], set()).add(key)
+        else:
+            results[key] = result
+    for meter, keys in pending.items():
+        keys = list(keys)
+        schemes = [scheme for scheme, _ in keys]
+        if meter is get_meter_group():
+            # verses with meter="auto" which fit no meter are hexameters
+            # without realizations (see Verse.match_metrical_sequences)
+            matches = match_schemes_with_group(schemes, meter)
+            for key, match in zip(keys, matches):
+                results[key] = make_match_result(
+                    *(match or (HEXAMETER, {})))
+        else:
+            encoded = encode_meter(meter)
+            for key, indices in zip(keys, match_schemes(schemes, meter)):
+                results[key] = make_match_result(
+                    meter, encoded.get_sequences(indices))
+        for key in keys:
+            SCHEME_CACHE.put(key, results[key])
+    for verse in verses:
+        verse.set_match_result(results[verse.get_scheme_key()])
+    return
+
+def iter_matched_verses(lines, *args, batch_size=BATCH_SIZE, **kwargs):
+    """Yields Verse(line, *args, **kwargs) for each line with its scheme
+    already matched, batch_size verses at once."""
+    batch = []
+    for line in lines:
+        batch.append(Verse(line, *args, **kwargs))
+        if len(batch) == batch_size:
+            match_verses(batch)
+            yield from batch
+            batch = []
+    match_verses(batch)
+    yield from batch
+    return
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(
+        description="Compares matching schemes of the verses one by one"
+                    " (Meter.match) and in batches (match_schemes):"
+                    " prints the schemes matched differently and the time"
+                    " of both.")
+    argparser.add_argument("paths", nargs="*",
+                           help="files with verses (default:"
+                                " perseus_corpus/*)")
+    argparser.add_argument("-m", "--meter", default="hexameter",
+                           help="meter (default: hexameter)")
+    argparser.add_argument("-b", "--batch-size", type=int,
+                           default=BATCH_SIZE,
+                           help=f"schemes matched at once"
+                                f" (default: {BATCH_SIZE})")
+    args = argparser.parse_args()
+
+    if np is None:
+        print("ERROR: batch.py needs NumPy (pip install numpy)")
+        sys.exit(1)
+    meter = get_meter(args.meter)
+    schemes = []
+    for path in args.paths or sorted(glob.glob("perseus_corpus/*")):
+        with open(path, "r") as file:
+            for line in file:
+                verse = Verse(line, meter=meter)
+                schemes.append(verse.scheme)
+
+    start = time.perf_counter()
+    one_by_one = [list(meter.match(scheme)) for scheme in schemes]
+    one_by_one_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    encoded = encode_meter(meter)
+    batched = []
+    for i in range(0, len(schemes), args.batch_size):
+        batched.extend(
+            list(encoded.get_sequences(indices)) for indices
+            in match_schemes(schemes[i:i+args.batch_size], meter))
+    batched_seconds = time.perf_counter() - start
+
+    differences = 0
+    for scheme, expected, result in zip(schemes, one_by_one, batched):
+        if expected != result:
+            differences += 1
+            print(f"{scheme}\n\tone by one: {expected}\n\tbatch: {result}")
+    print(f"{len(schemes)} schemes, {differences} differences\n"
+          f"one by one: {one_by_one_seconds:.3f} s\n"
+          f"in batches of {args.batch_size}: {batched_seconds:.3f} s")
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import glob
+import json
+import time
+import platform
+import argparse
+
+from scan import Verse, SCHEME_CACHE, WORD_CACHE
+from lengths import LengthDictionary, open_length_dictionary
+from profiling import percentile
+
+DEFAULT_PATHS = (sorted(glob.glob("perseus_corpus/*"))
+                 + sorted(glob.glob("tests/*.txt")))
+DICTIONARY_PATHS = (".default_length_dictionary.pickle",
+                    ".default_length_dictionary.bin")
+
+# stages of Verse.__init__ in the order they are run; segmentize and
+# add_lengths are timed on their own, analyse is the cached combination
+# of both which Verse really uses, and generate_candidate_sequences +
+# find_metrical_sequences is the reference for match_metrical_sequences
+STAGES = ("normalize", "tokenize", "segmentize", "add_lengths", "analyse",
+          "elide", "analyse_codas", "make_scheme",
+          "generate_candidate_sequences", "find_metrical_sequences",
+          "match_metrical_sequences", "scan")
+# stages a Verse runs by default
+PIPELINE = ("normalize", "tokenize", "analyse", "elide", "analyse_codas",
+            "make_scheme", "match_metrical_sequences", "scan")
+
+
+def time_stages(line, length_dictionary, timings):
+    """Runs all stages on the line, appends the time of each of them
+    (in seconds) to timings[stage]."""
+    clock = time.perf_counter
+    verse = Verse(line, length_dictionary=length_dictionary, idle=True)
+
+    def run(stage, function):
+        start = clock()
+        function()
+        timings[stage].append(clock()-start)
+
+    def segmentize():
+        for token in verse.tokens:
+            token.segmentize()
+
+    def add_lengths():
+        if length_dictionary:
+            for token in verse.tokens:
+                token.add_lengths()
+
+    def analyse():
+        for token in verse.tokens:
+            token.analyse()
+
+    run("normalize", verse.normalize)
+    run("tokenize", verse.tokenize)
+    run("segmentize", segmentize)
+    run("add_lengths", add_lengths)
+    run("analyse", analyse)   # replaces the segments by the same ones
+    run("elide", verse.elide)
+    run("analyse_codas", verse.analyse_codas)
+    run("make_scheme", verse.make_scheme)
+    run("generate_candidate_sequences", verse.generate_candidate_sequences)
+    run("find_metrical_sequences", verse.find_metrical_sequences)
+    run("match_metrical_sequences", verse.match_metrical_sequences)
+    run("scan", verse.scan)
+    return
+
+def summarize(times):
+    """Returns total time, verses per second and latency percentiles
+    (in microseconds) of a list of per-verse times."""
+    times = sorted(times)
+    total = sum(times)
+    return {
+        "total_s": round(total, 4),
+        "verses_per_s": round(len(times)/total, 1) if total else None,
+        "p50_us": round(percentile(times, 0.5)*1e6, 1),
+        "p90_us": round(percentile(times, 0.9)*1e6, 1),
+        "p99_us": round(percentile(times, 0.99)*1e6, 1),
+        "max_us": round(times[-1]*1e6, 1) if times else 0.0,
+        }
+
+def read_lines(paths, limit=None):
+    lines = []
+    for path in paths:
+        with open(path, "r") as file:
+            lines.extend(file.readlines()[:limit])
+    return lines
+
+def benchmark_stages(lines, length_dictionary):
+    timings = {stage: [] for stage in STAGES}
+    verse_times = []   # whole Verse as it is built normally
+    # both passes start with empty caches
+    SCHEME_CACHE.clear()
+    WORD_CACHE.clear()
+    for line in lines:
+        time_stages(line, length_dictionary, timings)
+    SCHEME_CACHE.clear()
+    WORD_CACHE.clear()
+    for line in lines:
+        start = time.perf_counter()
+        # matching and scanning are lazy, so they are asked for here
+        Verse(line, length_dictionary=length_dictionary).scansions
+        verse_times.append(time.perf_counter()-start)
+    results = {stage: summarize(times) for stage, times in timings.items()}
+    pipeline_times = [sum(stage_times) for stage_times
+                      in zip(*[timings[stage] for stage in PIPELINE])]
+    results["pipeline"] = summarize(pipeline_times)
+    results["verse"] = summarize(verse_times)
+    return results, len(verse_times)
+
+def benchmark_dictionary_load(repeat=5):
+    results = {}
+    for path in DICTIONARY_PATHS:
+        if not os.path.exists(path):
+            continue
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            open_length_dictionary(path)
+            times.append(time.perf_counter()-start)
+        results[path] = round(min(times)*1000, 3)   # in milliseconds
+    return results
+
+def benchmark_training(lines):
+    length_dictionary = LengthDictionary()
+    length_dictionary.frequencies = {}
+    start = time.perf_counter()
+    length_dictionary.count_length_frequencies_in_lines(
+        lines, length_dictionary.frequencies, length_dictionary=None)
+    length_dictionary.make_length_dictionary()
+    return round(time.perf_counter()-start, 3)
+
+def run_benchmark(paths, limit=None, caches=True, training=True):
+    if not caches:
+        SCHEME_CACHE.resize(0)
+        WORD_CACHE.resize(0)
+    results = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "paths": list(paths),
+        "limit": limit,
+        "caches": caches,
+        }
+    results["dictionary_load_ms"] = benchmark_dictionary_load()
+    length_dictionary = open_length_dictionary(DICTIONARY_PATHS[-1]
+        if os.path.exists(DICTIONARY_PATHS[-1]) else DICTIONARY_PATHS[0])
+    lines = read_lines(paths, limit)
+    results["stages"], results["verses"] = benchmark_stages(
+        lines, length_dictionary)
+    if training:
+        results["training_s"] = benchmark_training(lines)
+    return results
+
+def print_results(results, file=sys.stdout):
+    print(f"VERSES: {results['verses']}\n", file=file)
+    print("stage\t\t\t\tverses/s\tp50 µs\tp90 µs\tp99 µs\tmax µs",
+          file=file)
+    for stage, stage_results in results["stages"].items():
+        print(f"{stage:<32}{stage_results['verses_per_s']}"
+              f"\t{stage_results['p50_us']}\t{stage_results['p90_us']}"
+              f"\t{stage_results['p99_us']}\t{stage_results['max_us']}",
+              file=file)
+    print(file=file)
+    for path, milliseconds in results["dictionary_load_ms"].items():
+        print(f"load {path}: {milliseconds} ms", file=file)
+    if "training_s" in results:
+        print(f"training: {results['training_s']} s", file=file)
+    return
+
+def find_regressions(results, baseline, threshold=0.1):
+    """Returns descriptions of stages (and loading and training) which
+    are more than threshold (relative) slower than in the baseline."""
+    regressions = []
+    def compare(name, new, old):
+        if old and new is not None and new > old*(1+threshold):
+            regressions.append(f"{name}: {old} -> {new}"
+                               f" (+{(new/old-1)*100:.0f} %)")
+    for stage, stage_results in results["stages"].items():
+        old_results = baseline.get("stages", {}).get(stage)
+        if old_results is None:
+            continue
+        for key in ("total_s", "p50_us", "p90_us"):
+            compare(f"{stage} {key}", stage_results[key],
+                    old_results.get(key))
+    for path, milliseconds in results["dictionary_load_ms"].items():
+        compare(f"load {path} ms", milliseconds,
+                baseline.get("dictionary_load_ms", {}).get(path))
+    compare("training_s", results.get("training_s"),
+            baseline.get("training_s"))
+    return regressions
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(
+        description="Times each stage of scanning, loading the length"
+                    " dictionary and training it.")
+    argparser.add_argument("paths", nargs="*",
+                           help=("files with verses (default:"
+                                 " perseus_corpus/* and tests/*.txt)"))
+    argparser.add_argument("-o", "--output",
+                           help="save the results as JSON to this file",
+                           default="benchmark_results.json")
+    argparser.add_argument("--compare",
+                           help=("JSON results of a previous run; report"
+                                 " stages which got slower"))
+    argparser.add_argument("--threshold",
+                           help=("relative slowdown reported as"
+                                 " a regression (default: 0.1)"),
+                           type=float, default=0.1)
+    argparser.add_argument("--limit",
+                           help="time only the first N lines of each file",
+                           type=int)
+    argparser.add_argument("--no-caches",
+                           help="disable the scheme and word caches",
+                           action="store_true")
+    argparser.add_argument("--no-training",
+                           help="do not time training the dictionary",
+                           action="store_true")
+    args = argparser.parse_args()
+
+    results = run_benchmark(args.paths or DEFAULT_PATHS, args.limit,
+                            caches=not args.no_caches,
+                            training=not args.no_training)
+    print_results(results)
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2, ensure_ascii=False)
+
+    if args.compare:
+        with open(args.compare, "r") as file:
+            baseline = json.load(file)
+        regressions = find_regressions(results, baseline, args.threshold)
+        if regressions:
+            print("\nREGRESSIONS:", *regressions, sep="\n")
+            sys.exit(1)
+        print("\nno regressions")
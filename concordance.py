@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import glob
+import json
+import time
+import sqlite3
+import argparse
+
+from scan import strip_diacritics
+from lengths import (DEFAULT_LENGTH_DICTIONARY, LengthDictionary,
+                     open_length_dictionary)
+from batch import iter_matched_verses
+
+DEFAULT_CONCORDANCE = ".concordance.sqlite"
+DEFAULT_PATHS = sorted(glob.glob("perseus_corpus/*"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS verses (
+    id INTEGER PRIMARY KEY,
+    path TEXT,
+    line INTEGER,
+    text TEXT,
+    scansion_count INTEGER,
+    full_sequence TEXT
+);
+CREATE TABLE IF NOT EXISTS occurrences (
+    form TEXT,
+    word TEXT,
+    verse_id INTEGER,
+    position INTEGER,
+    lengths TEXT,
+    foot INTEGER,
+    foot_position INTEGER,
+    metrical_positions TEXT
+);
+"""
+# created after the occurrences are inserted, which is faster
+INDEX = "CREATE INDEX IF NOT EXISTS occurrences_form ON occurrences (form)"
+
+# lengths of monophthongs as they are stored
+LENGTH_MARKS = {"long": "-", "short": "u", "unknown": "?"}
+
+
+def get_metrical_positions(full_sequence):
+    """Returns (foot, position in the foot) of each syllable of
+    the full metrical sequence (e.g. "-uu|--|..."), counted from 1."""
+    return [(foot, position)
+            for foot, syllables in enumerate(full_sequence.split("|"), 1)
+            for position in range(1, len(syllables)+1)]
+
+def index_verse(verse):
+    """Returns the occurrences of words in the verse as tuples
+    (form, word, position, lengths, foot, position in the foot, metrical
+    positions). Lengths inferred from the scansion (see
+    LengthDictionary.infer_lengths) and metrical positions are only known
+    in verses which are scanned unambiguously; in other verses, only
+    the lengths given by the input or the dictionary are known, and
+    the metrical positions are None."""
+    if verse.scansion_count == 1:
+        sequence = verse.metrical_sequences[0]
+        positions = get_metrical_positions(verse.full_metrical_sequences[0])
+    else:
+        # no syllable can be inferred as long or short
+        sequence = "o"*len(verse.scheme)
+        positions = None
+    occurrences = []
+    for position, (token, form, lengths, first_syllable_i, syllable_count) \
+            in enumerate(LengthDictionary.infer_lengths(verse.tokens,
+                                                        sequence), 1):
+        foot = foot_position = metrical_positions = None
+        if positions is not None and syllable_count:
+            foot, foot_position = positions[first_syllable_i]
+            metrical_positions = " ".join(
+                f"{foot}.{position_in_foot}" for foot, position_in_foot
+                in positions[first_syllable_i:
+                             first_syllable_i+syllable_count])
+        occurrences.append((
+            form, token.original_form, position,
+            "".join(LENGTH_MARKS[length] for length in lengths),
+            foot, foot_position, metrical_positions))
+    return occurrences
+
+
+class Concordance():
+    """Index of word forms (lower-case, without diacritics) in a corpus:
+    for each occurrence, the verse (file, line number, text), position of
+    the word in the verse, lengths of its monophthongs ("-" long, "u"
+    short, "?" unknown) and metrical positions of its syllables (foot
+    and position in the foot, e.g. "2.2 2.3 3.1"), stored in SQLite."""
+
+    def __init__(self, path=DEFAULT_CONCORDANCE):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def build(self, paths, length_dictionary=None, file=sys.stderr):
+        """Scans the files and indexes the words of their verses
+        (replacing what was indexed from them before)."""
+        with self.connection:
+            self.connection.execute("DROP INDEX IF EXISTS occurrences_form")
+            for path in paths:
+                self.remove(path)
+                start = time.perf_counter()
+                with open(path, "r") as input_file:
+                    lines = list(input_file)
+                verse_count = 0
+                for line_number, verse in enumerate(iter_matched_verses(
+                        lines, length_dictionary=length_dictionary), 1):
+                    # skip empty lines or too short lines (with verse
+                    # numbers)
+                    if len(verse.original_form) < 10:
+                        continue
+                    verse_id = self.connection.execute(
+                        "INSERT INTO verses (path, line, text,"
+                        " scansion_count, full_sequence)"
+                        " VALUES (?, ?, ?, ?, ?)",
+                        (path, line_number, verse.original_form.rstrip("\n"),
+                         verse.scansion_count,
+                         verse.full_metrical_sequences[0]
+                         if verse.scansion_count == 1 else None)).lastrowid
+                    self.connection.executemany(
+                        "INSERT INTO occurrences VALUES"
+                        " (?, ?, ?, ?, ?, ?, ?, ?)",
+                        [(form, word, verse_id, position, lengths, foot,
+                          foot_position, metrical_positions)
+                         for (form, word, position, lengths, foot,
+                              foot_position, metrical_positions)
+                         in index_verse(verse)])
+                    verse_count += 1
+                print(f"DONE: {path} ({verse_count} verses,"
+                      f" {time.perf_counter()-start:.1f} s)", file=file)
+            self.connection.execute(INDEX)
+        return
+
+    def remove(self, path):
+        self.connection.execute(
+            "DELETE FROM occurrences WHERE verse_id IN"
+            " (SELECT id FROM verses WHERE path = ?)", (path,))
+        self.connection.execute("DELETE FROM verses WHERE path = ?", (path,))
+
+    def find(self, word, foot=None, limit=None):
+        """Returns the occurrences of the word form (diacritics and cases
+        are ignored) as dictionaries, in the order of the corpus;
+        with foot, only those starting in the foot."""
+        query = ("SELECT path, line, text, scansion_count, full_sequence,"
+                 " word, position, lengths, foot, foot_position,"
+                 " metrical_positions FROM occurrences"
+                 " JOIN verses ON verses.id = verse_id WHERE form = ?")
+        parameters = [strip_diacritics(word.lower())]
+        if foot is not None:
+            query += " AND foot = ?"
+            parameters.append(foot)
+        query += " ORDER BY verse_id, position"
+        if limit is not None:
+            query += " LIMIT ?"
+            parameters.append(limit)
+        columns = ("path", "line", "text", "scansion_count", "full_sequence",
+                   "word", "position", "lengths", "foot", "foot_position",
+                   "metrical_positions")
+        return [dict(zip(columns, row))
+                for row in self.connection.execute(query, parameters)]
+
+    def close(self):
+        self.connection.close()
+
+
+def print_occurrences(occurrences, file=sys.stdout):
+    for occurrence in occurrences:
+        metrical_positions = (occurrence["metrical_positions"]
+                              or f"{occurrence['scansion_count']} scansions")
+        print(f"{occurrence['path']}:{occurrence['line']}"
+              f"\t{occurrence['word']} ({occurrence['position']})"
+              f"\t{occurrence['lengths']}\t{metrical_positions}"
+              f"\t{occurrence['text']}", file=file)
+    return
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(
+        description="Concordance of word forms in a corpus: each occurrence"
+                    " with lengths of its vowels and metrical positions of"
+                    " its syllables (foot.position).")
+    argparser.add_argument("--concordance", default=DEFAULT_CONCORDANCE,
+                           help=("the index"
+                                 f" (default: {DEFAULT_CONCORDANCE})"))
+    subparsers = argparser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser(
+        "build", help="index the words of the files")
+    build_parser.add_argument("paths", nargs="*",
+                              help="files with verses (default:"
+                                   " perseus_corpus/*)")
+    build_parser.add_argument("--nolengths",
+                              help="don't try to add unambiguous lengths",
+                              action="store_true")
+    build_parser.add_argument("-d", "--dictionary",
+                              help=("length dictionary; default:"
+                                    f" {DEFAULT_LENGTH_DICTIONARY}"),
+                              default=DEFAULT_LENGTH_DICTIONARY)
+    query_parser = subparsers.add_parser(
+        "query", help="print the occurrences of the word forms")
+    query_parser.add_argument("words", nargs="+")
+    query_parser.add_argument("--foot", type=int,
+                              help="only occurrences starting in this foot")
+    query_parser.add_argument("--limit", type=int,
+                              help="at most this many occurrences of each"
+                                   " form")
+    query_parser.add_argument("--json", action="store_true",
+                              help="print the occurrences as JSON lines")
+    args = argparser.parse_args()
+
+    if args.command == "build":
+        length_dictionary = None
+        if not args.nolengths:
+            length_dictionary = open_length_dictionary(args.dictionary)
+        concordance = Concordance(args.concordance)
+        concordance.build(args.paths or DEFAULT_PATHS, length_dictionary)
+    else:
+        if not os.path.exists(args.concordance):
+            print(f"ERROR: concordance {args.concordance!r} not found"
+                  " (run concordance.py build first)")
+            sys.exit(1)
+        concordance = Concordance(args.concordance)
+        for word in args.words:
+            occurrences = concordance.find(word, args.foot, args.limit)
+            if args.json:
+                for occurrence in occurrences:
+                    print(json.dumps(occurrence, ensure_ascii=False))
+            else:
+                print(f"{word}: {len(occurrences)} occurrences")
+                print_occurrences(occurrences)
+    concordance.close()
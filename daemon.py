@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+
+# daemon for app.py (app.py --daemon) and its client (app.py --client);
+# the client only forwards its arguments, working directory and stdin,
+# so this module must not import the scanner
+
+import sys
+import os
+import json
+import stat
+import time
+import socket
+import struct
+import tempfile
+import threading
+import traceback
+import subprocess
+import contextlib
+import socketserver
+
+# the socket is in a directory only the user can access: the runtime
+# directory of the user, or a private directory in /tmp (anyone else
+# could create a socket in /tmp itself and get the arguments and stdin
+# of the client)
+if os.path.isdir(os.environ.get("XDG_RUNTIME_DIR", "")):
+    SOCKET_DIRECTORY = os.environ["XDG_RUNTIME_DIR"]
+else:
+    SOCKET_DIRECTORY = os.path.join(tempfile.gettempdir(),
+                                    f"semetrika-{os.getuid()}")
+DEFAULT_SOCKET = os.path.join(SOCKET_DIRECTORY, "semetrika.sock")
+DEFAULT_IDLE_TIMEOUT = 600   # seconds
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "app.py")
+START_TIMEOUT = 10   # seconds to wait for a started daemon
+
+# output of the daemon is sent in frames, one JSON object per line:
+# {"stdout": text}, {"stderr": text}, and finally {"exit": code}
+FRAME_SIZE = 65536
+
+
+class FrameWriter():
+    """File-like object for sys.stdout or sys.stderr of the daemon,
+    sending what is written to the client (in the original order of
+    both streams)."""
+
+    def __init__(self, frames, stream):
+        self.frames = frames
+        self.stream = stream
+
+    def write(self, text):
+        self.frames.add(self.stream, text)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class Frames():
+    """Buffer of output frames, sent when it gets large."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.frames = []   # [stream, text]
+        self.size = 0
+
+    def add(self, stream, text):
+        if self.frames and self.frames[-1][0] == stream:
+            self.frames[-1][1] += text
+        else:
+            self.frames.append([stream, text])
+        self.size += len(text)
+        if self.size >= FRAME_SIZE:
+            self.send()
+
+    def send(self, **final):
+        lines = [json.dumps({stream: text}, ensure_ascii=False)+"\n"
+                 for stream, text in self.frames]
+        if final:
+            lines.append(json.dumps(final)+"\n")
+        self.connection.sendall("".join(lines).encode("utf-8"))
+        self.frames = []
+        self.size = 0
+
+
+# daemon
+# ------
+
+class DaemonRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        # the first line is the request, the rest is stdin of the client
+        stdin = self.connection.makefile("r", encoding="utf-8")
+        line = stdin.readline()
+        if not line:   # only checking that the daemon is running
+            return
+        request = json.loads(line)
+        frames = Frames(self.connection)
+        cwd = os.getcwd()
+        exit_code = 0
+        try:
+            os.chdir(request["cwd"])
+            with contextlib.redirect_stdout(FrameWriter(frames, "stdout")), \
+                 contextlib.redirect_stderr(FrameWriter(frames, "stderr")):
+                sys.stdin = stdin
+                try:
+                    self.server.main(request["argv"])
+                except SystemExit as exit:
+                    if exit.code is None or isinstance(exit.code, int):
+                        exit_code = exit.code or 0
+                    else:   # sys.exit(message)
+                        print(exit.code, file=sys.stderr)
+                        exit_code = 1
+                except Exception:
+                    traceback.print_exc()
+                    exit_code = 1
+        finally:
+            sys.stdin = sys.__stdin__
+            os.chdir(cwd)
+        try:
+            frames.send(exit=exit_code)
+        except OSError:   # the client is gone
+            pass
+
+
+class ScanDaemon(socketserver.UnixStreamServer):
+    """Server running main (of app.py) for each request of a client,
+    one request at a time. It stops when no request comes for
+    idle_timeout seconds."""
+
+    def __init__(self, socket_path, main, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self.main = main
+        self.timeout = idle_timeout
+        self.idle = False
+        super().__init__(socket_path, DaemonRequestHandler)
+
+    def handle_timeout(self):
+        self.idle = True
+
+    def serve_until_idle(self):
+        while not self.idle:
+            self.handle_request()
+        return
+
+
+def check_socket_directory(socket_path):
+    """Creates the directory of the socket if it is the default private
+    one; raises ConnectionError unless the directory belongs to the user
+    and nobody else can write to it."""
+    directory = os.path.dirname(os.path.abspath(socket_path))
+    if directory == SOCKET_DIRECTORY:
+        with contextlib.suppress(FileExistsError):
+            os.mkdir(directory, 0o700)
+    try:
+        status = os.lstat(directory)
+    except FileNotFoundError:
+        raise ConnectionError(f"directory {directory!r} does not exist")
+    if (
+        not stat.S_ISDIR(status.st_mode) or
+        status.st_uid != os.getuid() or
+        status.st_mode & 0o022
+        ):
+        raise ConnectionError(f"directory {directory!r} must belong to"
+                              " the user and be writable only by them")
+
+def check_socket(socket_path, connection):
+    """Raises ConnectionError unless the socket belongs to the user and
+    (where it can be checked) so does the daemon listening on it."""
+    status = os.lstat(socket_path)
+    if not stat.S_ISSOCK(status.st_mode) or status.st_uid != os.getuid():
+        raise ConnectionError(f"{socket_path!r} is not a socket of the user")
+    if hasattr(socket, "SO_PEERCRED"):   # Linux
+        credentials = connection.getsockopt(
+            socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        _, uid, _ = struct.unpack("3i", credentials)
+        if uid != os.getuid():
+            raise ConnectionError(f"the daemon on {socket_path!r} runs"
+                                  " as another user")
+
+def is_running(socket_path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        try:
+            connection.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return False
+    return True
+
+def run_daemon(main, socket_path=DEFAULT_SOCKET,
+               idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    """Serves requests of clients until it is idle for idle_timeout
+    seconds. Returns False if another daemon already listens on the
+    socket."""
+    check_socket_directory(socket_path)
+    if is_running(socket_path):
+        return False
+    if os.path.exists(socket_path):   # left by a daemon which was killed
+        os.unlink(socket_path)
+    umask = os.umask(0o077)   # only the user can connect
+    try:
+        daemon = ScanDaemon(socket_path, main, idle_timeout)
+    finally:
+        os.umask(umask)
+    try:
+        daemon.serve_until_idle()
+    finally:
+        daemon.server_close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(socket_path)
+    return True
+
+
+# client
+# ------
+
+def start_daemon(socket_path, idle_timeout):
+    """Starts a daemon in the background and waits until it listens."""
+    subprocess.Popen([sys.executable, APP_PATH, "--daemon",
+                      "--socket", socket_path,
+                      "--idle-timeout", str(idle_timeout)],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                     stderr=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        if is_running(socket_path):
+            return True
+        time.sleep(0.01)
+    return False
+
+def connect(socket_path, idle_timeout):
+    """Returns a connection to the daemon, starting it if needed."""
+    check_socket_directory(socket_path)
+    for attempt in range(2):
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            connection.close()
+            if attempt or not start_daemon(socket_path, idle_timeout):
+                break
+            continue
+        try:
+            check_socket(socket_path, connection)
+        except ConnectionError:
+            connection.close()
+            raise
+        return connection
+    raise ConnectionError(f"cannot start the daemon on {socket_path!r}")
+
+def send_stdin(connection):
+    try:
+        # os.read, because a thread blocked in sys.stdin.buffer would
+        # prevent the client from exiting
+        stdin = sys.stdin.fileno()
+        for chunk in iter(lambda: os.read(stdin, FRAME_SIZE), b""):
+            connection.sendall(chunk)
+        connection.shutdown(socket.SHUT_WR)
+    except OSError:   # the daemon does not read stdin (e.g. with --input)
+        pass
+
+def get_client_option(argv, option, default):
+    """Returns the value of an option (--option VALUE or --option=VALUE)
+    and argv without it."""
+    rest = []
+    value = default
+    i = 0
+    while i < len(argv):
+        if argv[i] == option and i+1 < len(argv):
+            value = argv[i+1]
+            i += 2
+            continue
+        if argv[i].startswith(option+"="):
+            value = argv[i][len(option)+1:]
+        else:
+            rest.append(argv[i])
+        i += 1
+    return value, rest
+
+def run_client(argv):
+    """Runs app.py with the arguments in the daemon (which is started
+    if it is not running), prints its output, returns its exit code."""
+    argv = [arg for arg in argv if arg != "--client"]
+    socket_path, argv = get_client_option(argv, "--socket", DEFAULT_SOCKET)
+    idle_timeout, argv = get_client_option(argv, "--idle-timeout",
+                                           DEFAULT_IDLE_TIMEOUT)
+    if "--daemon" in argv:
+        print("app.py: error: --daemon cannot be used with --client",
+              file=sys.stderr)
+        return 2
+    try:
+        connection = connect(socket_path, float(idle_timeout))
+    except (ConnectionError, ValueError) as error:
+        print(f"ERROR: {error}", file=sys.stderr)
+        return 1
+    with connection:
+        request = {"argv": argv, "cwd": os.getcwd()}
+        connection.sendall((json.dumps(request)+"\n").encode("utf-8"))
+        # stdin is sent while the output is read, so that neither of them
+        # can fill up the socket and block the other
+        threading.Thread(target=send_stdin, args=(connection,),
+                         daemon=True).start()
+        streams = {"stdout": sys.stdout, "stderr": sys.stderr}
+        for line in connection.makefile("r", encoding="utf-8"):
+            frame = json.loads(line)
+            if "exit" in frame:
+                sys.stdout.flush()
+                return frame["exit"]
+            for stream, text in frame.items():
+                streams[stream].write(text)
+                if stream == "stderr":
+                    sys.stderr.flush()
+    print("ERROR: the daemon closed the connection", file=sys.stderr)
+    return 1
@@ -2,7 +2,15 @@
 
 import sys
 import os
+import time
+import mmap
+import hashlib
 import pickle
+import struct
+import argparse
+import itertools
+import multiprocessing
+from collections.abc import Mapping
 
 from scan import *
 
@@ -18,6 +26,25 @@ class LengthDictionary(dict):
 
     @staticmethod
     def count_length_frequencies_for_verse(line, length_frequencies, tokens, sequence):
+        for token, form, lengths, _, _ in LengthDictionary.infer_lengths(
+                tokens, sequence):
+            # if the form wasn't encoutered yet, initialize it
+            if form not in length_frequencies:
+                length_frequencies[form] = [
+                    {"long": 0, "short": 0, "unknown": 0} for _ in lengths
+                    ]
+            for vowel_i, length in enumerate(lengths):
+                length_frequencies[form][vowel_i][length] += 1
+        return
+
+    # lengths of monophthongs which can be inferred from the verse
+    # scanned as the sequence (also used by concordance.py)
+    @staticmethod
+    def infer_lengths(tokens, sequence):
+        """Yields (token, its form without diacritics, lengths, index of
+        its first syllable in the verse, number of its syllables) for each
+        word token; lengths are "long", "short" or "unknown" for each of
+        its monophthongs."""
         sequence_i = 0
         
         for token in tokens:
@@ -26,17 +53,9 @@ class LengthDictionary(dict):
                     
             form = strip_diacritics(token.lowercase_form)
             segments = token.segments            
+            first_syllable_i = sequence_i
+            lengths = []
 
-            # if the form wasn't encoutered yet, initialize it
-            if form not in length_frequencies:
-                vowels = []
-                for segment in segments:
-                    # diphthongs and final nasal vowels always scan as long, so they are not interesting
-                    if segment.subtype == "monophthong":
-                        vowels.append({"long": 0, "short": 0, "unknown": 0})
-                length_frequencies[form] = vowels
-
-            vowel_i = 0
             for segment in segments:
                 # diphthongs and final nasal vowels always scan as long, so they are not interesting
                 if segment.subtype == "monophthong":
@@ -45,30 +64,32 @@ class LengthDictionary(dict):
                         # known (either because it was given in user's input, or
                         # because it was in a previously created length dictionary)
                         if segment.length == "long" or segment.length == "short":
-                            length_frequencies[form][vowel_i][segment.length] += 1
+                            lengths.append(segment.length)
                         # if the syllable is short, the vowel has to be short as well
                         elif sequence[sequence_i] == "u":
-                            length_frequencies[form][vowel_i]["short"] += 1
+                            lengths.append("short")
                         # if the syllable is long, we can infer the vowel is short
                         # only if it is in a positively open syllable
                         elif sequence[sequence_i] == "-" and segment.coda == "open":
-                            length_frequencies[form][vowel_i]["long"] += 1
+                            lengths.append("long")
                         # vowel in a (possibly) closed syllable
                         else:
-                            length_frequencies[form][vowel_i]["unknown"] += 1
+                            lengths.append("unknown")
                     else:
                         if segment.length == "long" or segment.length == "short":
-                            length_frequencies[form][vowel_i][segment.length] += 1
+                            lengths.append(segment.length)
                         else:
-                            length_frequencies[form][vowel_i]["unknown"] += 1
-                    vowel_i += 1
+                            lengths.append("unknown")
                 if segment.type_ == "vowel" and not segment.elided:
                     sequence_i += 1
-                    
+
+            yield (token, form, lengths, first_syllable_i,
+                   sequence_i - first_syllable_i)
         return
 
     # for each word token in unambigously scanned verses,
     # count how many times each of its vowels was found short, long, or unknown
+    # (the counts are added to the frequencies counted so far)
     def count_length_frequencies(self, paths, *args, **kwargs):
         print("I am trying to learn which vowel lengths",
               "in which words are unambiguous.",
@@ -76,19 +97,116 @@ class LengthDictionary(dict):
               "(if it doesn't, the corpus you have given me",
               "is probably too small).",
              file=sys.stderr)
+        if self.frequencies is None:
+            self.frequencies = {}
+        for path in paths:
+            self.count_length_frequencies_in_file(path, self.frequencies,
+                                                  *args, **kwargs)
+            print(f"DONE: {path}", file=sys.stderr)
+        return
+
+    @classmethod
+    def count_length_frequencies_in_file(cls, path, length_frequencies,
+                                         *args, **kwargs):
+        with open(path, "r") as file:
+            cls.count_length_frequencies_in_lines(file, length_frequencies,
+                                                  *args, **kwargs)
+        return
+
+    @classmethod
+    def count_length_frequencies_in_lines(cls, lines, length_frequencies,
+                                          *args, **kwargs):
+        # schemes of the verses are matched in batches (see batch.py,
+        # imported only here, so that scanning does not load NumPy)
+        from batch import iter_matched_verses
+        for verse in iter_matched_verses(lines, *args, **kwargs):
+            line = verse.original_form
+            if len(verse.metrical_sequences) == 1:   # consider only unambiguously analysed verses
+                cls.count_length_frequencies_for_verse(line, length_frequencies,
+                                                       verse.tokens,
+                                                       verse.metrical_sequences[0])
+        return
+
+    # the same as count_length_frequencies (without a length dictionary),
+    # but shards of shard_size lines are counted by a pool of jobs
+    # processes and their frequencies are then merged in the original
+    # order, so the result is identical
+    def count_length_frequencies_in_parallel(self, paths, jobs,
+                                             shard_size=1000,
+                                             unmarked_short=False):
+        if self.frequencies is None:
+            self.frequencies = {}
+        for path, frequencies in count_frequencies_by_file(
+                paths, jobs, shard_size, unmarked_short):
+            merge_frequencies(self.frequencies, frequencies)
+            print(f"DONE: {path}", file=sys.stderr)
+        return
+
+    # like count_length_frequencies (without a length dictionary), but
+    # the frequencies of each file are saved in snapshot_directory, and
+    # files which have not changed since (same content hash, scanned by
+    # the same scan.py) are not scanned again, only their snapshots are
+    # merged
+    # (changed files can be counted in parallel, see
+    # count_length_frequencies_in_parallel)
+    def count_length_frequencies_incrementally(self, paths,
+                                               snapshot_directory,
+                                               unmarked_short=False,
+                                               jobs=1, shard_size=1000):
+        # imported here, result_cache.py imports this module
+        from result_cache import SCANNER_FINGERPRINT
+        os.makedirs(snapshot_directory, exist_ok=True)
+        file_frequencies = {}
+        changed_paths = {}   # path -> its hash
+        for path in paths:
+            content_hash = hash_file(path)
+            snapshot = load_snapshot(
+                get_snapshot_path(snapshot_directory, path))
+            if (
+                snapshot is not None and
+                snapshot["version"] == SNAPSHOT_VERSION and
+                snapshot["hash"] == content_hash and
+                snapshot.get("scanner") == SCANNER_FINGERPRINT and
+                snapshot["unmarked_short"] == unmarked_short
+            ):
+                file_frequencies[path] = snapshot["frequencies"]
+                print(f"UNCHANGED: {path}", file=sys.stderr)
+            else:
+                changed_paths[path] = content_hash
+
+        for path, frequencies in count_frequencies_by_file(
+                list(changed_paths), jobs, shard_size, unmarked_short):
+            save_snapshot(get_snapshot_path(snapshot_directory, path), {
+                "version": SNAPSHOT_VERSION,
+                "path": path,
+                "hash": changed_paths[path],
+                "scanner": SCANNER_FINGERPRINT,
+                "unmarked_short": unmarked_short,
+                "frequencies": frequencies,
+                })
+            file_frequencies[path] = frequencies
+            print(f"DONE: {path}", file=sys.stderr)
+
         length_frequencies = {}
         for path in paths:
-            with open(path, "r") as file:
-                for line in file:
-                    verse = Verse(line, *args)
-                    if len(verse.metrical_sequences) == 1:   # consider only unambiguously analysed verses
-                        self.count_length_frequencies_for_verse(line, length_frequencies,
-                                                           verse.tokens,
-                                                           verse.metrical_sequences[0])
-                print(f"DONE: {path}", file=sys.stderr)
+            merge_frequencies(length_frequencies, file_frequencies[path])
         self.frequencies = length_frequencies
         return
 
+    def save_frequencies(self, path):
+        """Saves only the frequencies (e.g. of one corpus) so that they can
+        be merged with others."""
+        with open(path, "wb") as file:
+            pickle.dump(self.frequencies, file)
+
+    def merge_frequencies(self, path):
+        """Adds the frequencies saved by save_frequencies to these."""
+        with open(path, "rb") as file:
+            frequencies = pickle.load(file)
+        if self.frequencies is None:
+            self.frequencies = {}
+        merge_frequencies(self.frequencies, frequencies)
+
     # find out which lengths in which words seem to be unambigous
     def make_length_dictionary(self,
                                minimal_frequency=20, maximum_of_contradictions=3):
@@ -120,17 +238,107 @@ class LengthDictionary(dict):
         self.dictionary = length_dictionary
         return
 
+    # the dictionary makes more verses unambiguous, and these can add
+    # new words to it; repeat until nothing changes, but in each round,
+    # rescan only the verses containing a word whose entry changed
+    def train_iteratively(self, paths, max_iterations=10,
+                          minimal_frequency=20, maximum_of_contradictions=3,
+                          unmarked_short=False):
+        """Counts frequencies as count_length_frequencies (without
+        a length dictionary), makes the dictionary, and then repeatedly
+        rescans verses with it until the dictionary stops changing (or
+        max_iterations rounds). Returns a report for each round:
+        (verses scanned, words in the dictionary, words gained, seconds)."""
+        lines = []
+        for path in paths:
+            with open(path, "r") as file:
+                lines.extend(file)
+        verse_frequencies = [None]*len(lines)   # what each verse added
+        form_index = {}   # word form -> ids of verses containing it
+        length_frequencies = {}
+        length_dictionary = None
+        verse_ids = range(len(lines))
+        report = []
+
+        # imported here, so that scanning does not load NumPy
+        from batch import iter_matched_verses
+        for iteration in range(max_iterations+1):
+            start = time.perf_counter()
+            verses = iter_matched_verses(
+                (lines[verse_id] for verse_id in verse_ids),
+                length_dictionary=length_dictionary,
+                unmarked_short=unmarked_short)
+            for verse_id, verse in zip(verse_ids, verses):
+                if iteration == 0:
+                    for token in verse.tokens:
+                        if token.type_ == "word":
+                            form_index.setdefault(
+                                strip_diacritics(token.lowercase_form),
+                                set()).add(verse_id)
+                # replace what the verse added in the previous round
+                if verse_frequencies[verse_id] is not None:
+                    add_verse_frequencies(length_frequencies,
+                                          verse_frequencies[verse_id], -1)
+                    verse_frequencies[verse_id] = None
+                if len(verse.metrical_sequences) == 1:
+                    frequencies = {}
+                    self.count_length_frequencies_for_verse(
+                        lines[verse_id], frequencies, verse.tokens,
+                        verse.metrical_sequences[0])
+                    verse_frequencies[verse_id] = tuple(
+                        (form, tuple((vowel["long"], vowel["short"],
+                                      vowel["unknown"])
+                                     for vowel in vowels))
+                        for form, vowels in frequencies.items()
+                        )
+                    add_verse_frequencies(length_frequencies,
+                                          verse_frequencies[verse_id], 1)
+
+            self.frequencies = length_frequencies
+            self.make_length_dictionary(minimal_frequency,
+                                        maximum_of_contradictions)
+            previous_dictionary = length_dictionary or {}
+            changed_forms = [
+                form for form in self.dictionary.keys() | previous_dictionary
+                if self.dictionary.get(form) != previous_dictionary.get(form)
+                ]
+            gained = len(self.dictionary) - len(previous_dictionary)
+            seconds = time.perf_counter() - start
+            report.append((len(verse_ids), len(self.dictionary), gained,
+                           seconds))
+            print(f"ITERATION {iteration}: {len(verse_ids)} verses scanned,",
+                  f"{len(self.dictionary)} words ({gained:+}),",
+                  f"{len(changed_forms)} entries changed, {seconds:.1f} s",
+                  file=sys.stderr)
+            if not changed_forms:   # fixed point
+                break
+            length_dictionary = self.dictionary
+            verse_ids = sorted(set().union(*[
+                form_index.get(form, ()) for form in changed_forms
+                ]))
+        return report
+
     def save(self, path):
         with open(path, "wb") as file:
             pickle.dump(self, file)
 
     def load(self, path, / , load_frequencies=False):
         with open(path, "rb") as file:
-            loaded = pickle.load(file)
+            loaded = LengthDictionaryUnpickler(file).load()
             self.dictionary = loaded.dictionary
             if load_frequencies:
                 self.frequencies = loaded.frequencies
 
+    # binary format, see MappedLengthDictionary
+    def save_binary(self, path):
+        save_binary_dictionary(self.dictionary, path)
+
+    def load_binary(self, path):
+        self.dictionary = {
+            word: list(lengths) for word, lengths
+            in MappedLengthDictionary(path).items()
+            }
+
     def print_with_lengths(self, word):
         token = Token(word, type_="word", length_dictionary=self.dictionary)
         token.normalize_cases()
@@ -154,13 +362,352 @@ class LengthDictionary(dict):
                     
 
 
-def make_default_length_dictionary():
-    paths = os.listdir("perseus_corpus")
+# frequency snapshots
+# -------------------
+
+# increase when the counting changes, so that old snapshots are not used
+SNAPSHOT_VERSION = 1
+DEFAULT_SNAPSHOT_DIRECTORY = ".frequency_snapshots"
+
+def merge_frequencies(length_frequencies, other_frequencies):
+    """Adds the counts in other_frequencies to length_frequencies."""
+    for form, other_vowels in other_frequencies.items():
+        vowels = length_frequencies.get(form)
+        if vowels is None:
+            length_frequencies[form] = [dict(vowel) for vowel
+                                        in other_vowels]
+            continue
+        if len(vowels) != len(other_vowels):
+            raise ValueError(f"{form!r} has {len(vowels)} vowels in one"
+                             + f" table and {len(other_vowels)} in the other")
+        for vowel, other_vowel in zip(vowels, other_vowels):
+            for length, count in other_vowel.items():
+                vowel[length] += count
+    return length_frequencies
+
+# counting frequencies in parallel
+# --------------------------------
+
+def count_shard(shard):
+    """Input: (index of the file, its lines, unmarked_short).
+    Returns the index and the frequencies counted in the lines."""
+    path_i, lines, unmarked_short = shard
+    frequencies = {}
+    LengthDictionary.count_length_frequencies_in_lines(
+        lines, frequencies, length_dictionary=None,
+        unmarked_short=unmarked_short)
+    return path_i, frequencies
+
+def count_frequencies_by_file(paths, jobs=1, shard_size=1000,
+                              unmarked_short=False):
+    """Yields (path, frequencies counted in it) for each path, in order.
+    With more than one job, shards of shard_size lines are counted
+    by a pool of processes and merged back in order."""
+    if jobs == 1:
+        for path in paths:
+            frequencies = {}
+            LengthDictionary.count_length_frequencies_in_file(
+                path, frequencies, length_dictionary=None,
+                unmarked_short=unmarked_short)
+            yield path, frequencies
+        return
+
+    def make_shards():
+        for path_i, path in enumerate(paths):
+            with open(path, "r") as file:
+                while True:
+                    lines = list(itertools.islice(file, shard_size))
+                    if not lines:
+                        break
+                    yield path_i, lines, unmarked_short
+
+    with multiprocessing.Pool(jobs) as pool:
+        frequencies = {}
+        next_path_i = 0   # the file whose shards are being merged
+        for path_i, shard_frequencies in pool.imap(count_shard,
+                                                   make_shards()):
+            # all shards of the previous files are merged
+            while next_path_i < path_i:
+                yield paths[next_path_i], frequencies
+                frequencies = {}
+                next_path_i += 1
+            merge_frequencies(frequencies, shard_frequencies)
+        while next_path_i < len(paths):
+            yield paths[next_path_i], frequencies
+            frequencies = {}
+            next_path_i += 1
+    return
+
+# frequencies of one verse are kept as a tuple of (form, tuple of
+# (long, short, unknown) for each vowel), which is much smaller than
+# the dictionaries; sign -1 subtracts them
+def add_verse_frequencies(length_frequencies, verse_frequencies, sign):
+    for form, vowels in verse_frequencies:
+        if form not in length_frequencies:
+            length_frequencies[form] = [
+                {"long": 0, "short": 0, "unknown": 0} for vowel in vowels
+                ]
+        for vowel, (long, short, unknown) in zip(length_frequencies[form],
+                                                 vowels):
+            vowel["long"] += sign*long
+            vowel["short"] += sign*short
+            vowel["unknown"] += sign*unknown
+    return
+
+def hash_file(path):
+    content_hash = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 16), b""):
+            content_hash.update(block)
+    return content_hash.hexdigest()
+
+def get_snapshot_path(snapshot_directory, path):
+    path_hash = hashlib.sha256(os.path.normpath(path).encode("utf-8"))
+    return os.path.join(
+        snapshot_directory,
+        f"{os.path.basename(path)}.{path_hash.hexdigest()[:12]}.pickle")
+
+def load_snapshot(snapshot_path):
+    try:
+        with open(snapshot_path, "rb") as file:
+            return pickle.load(file)
+    except FileNotFoundError:
+        return None
+
+def save_snapshot(snapshot_path, snapshot):
+    # write to a temporary file first, so that an interrupted training
+    # does not leave a broken snapshot behind
+    temporary_path = f"{snapshot_path}.tmp"
+    with open(temporary_path, "wb") as file:
+        pickle.dump(snapshot, file)
+    os.replace(temporary_path, snapshot_path)
+
+
+# the default dictionary was pickled from a script, so its class is
+# __main__.LengthDictionary
+class LengthDictionaryUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if module == "__main__" and name == "LengthDictionary":
+            return LengthDictionary
+        return super().find_class(module, name)
+
+
+# binary length dictionary
+# ------------------------
+
+# file layout (little-endian):
+#  header: magic, version, number of words
+#  offsets of the words in the word blob: (number of words + 1) x uint32
+#  lengths of the words: (number of words) x uint64, see pack_lengths
+#  word blob: words encoded in UTF-8, sorted (so they can be bisected)
+BINARY_MAGIC = b"SMLD"
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct("<4sII")
+
+# lengths of monophthongs in a word packed into an uint64: the lowest
+# 6 bits are the number of monophthongs, then 2 bits for each of them
+LENGTH_CODES = {"unknown": 0, "short": 1, "long": 2}
+CODE_LENGTHS = ("unknown", "short", "long")
+MAX_PACKED_LENGTHS = (64-6) // 2
+
+def pack_lengths(lengths):
+    if len(lengths) > MAX_PACKED_LENGTHS:
+        raise ValueError(f"cannot pack more than {MAX_PACKED_LENGTHS}"
+                         + " lengths")
+    packed = len(lengths)
+    for i, length in enumerate(lengths):
+        packed |= LENGTH_CODES[length] << (6 + 2*i)
+    return packed
+
+def unpack_lengths(packed):
+    return tuple(CODE_LENGTHS[(packed >> (6 + 2*i)) & 3]
+                 for i in range(packed & 63))
+
+def save_binary_dictionary(dictionary, path):
+    words = sorted(word.encode("utf-8") for word in dictionary)
+    offsets = [0]
+    for word in words:
+        offsets.append(offsets[-1]+len(word))
+    with open(path, "wb") as file:
+        file.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION,
+                                      len(words)))
+        file.write(struct.pack(f"<{len(offsets)}I", *offsets))
+        file.write(struct.pack(
+            f"<{len(words)}Q",
+            *[pack_lengths(dictionary[word.decode("utf-8")])
+              for word in words]
+            ))
+        file.write(b"".join(words))
+    return
+
+def is_binary_dictionary(path):
+    with open(path, "rb") as file:
+        return file.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+class MappedLengthDictionary(Mapping):
+    """Read-only length dictionary (word -> lengths of its monophthongs)
+    in the binary format. The file is memory-mapped and words are
+    looked up by bisection, so opening it costs almost nothing and
+    the pages are shared by all processes using the same file."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.word_count = BINARY_HEADER.unpack_from(
+            self.map)
+        if magic != BINARY_MAGIC or version != BINARY_VERSION:
+            raise ValueError(f"{path!r} is not a binary length dictionary"
+                             + f" (version {BINARY_VERSION})")
+        self.offsets_start = BINARY_HEADER.size
+        self.lengths_start = self.offsets_start + 4*(self.word_count+1)
+        self.words_start = self.lengths_start + 8*self.word_count
+        self.decoded = {}   # lengths of the words looked up so far
+
+    # workers of a pool get the path and map the file themselves
+    def __reduce__(self):
+        return (MappedLengthDictionary, (self.path,))
+
+    def word_bytes(self, i):
+        start, end = struct.unpack_from("<II", self.map,
+                                        self.offsets_start + 4*i)
+        return self.map[self.words_start+start:self.words_start+end]
+
+    def find(self, word):
+        """Returns the index of the word or -1."""
+        word = word.encode("utf-8")
+        low, high = 0, self.word_count
+        while low < high:
+            middle = (low+high) // 2
+            if self.word_bytes(middle) < word:
+                low = middle+1
+            else:
+                high = middle
+        if low < self.word_count and self.word_bytes(low) == word:
+            return low
+        return -1
+
+    def __getitem__(self, word):
+        lengths = self.decoded.get(word)
+        if lengths is None:
+            i = self.find(word) if isinstance(word, str) else -1
+            if i == -1:
+                raise KeyError(word)
+            packed, = struct.unpack_from("<Q", self.map,
+                                         self.lengths_start + 8*i)
+            lengths = unpack_lengths(packed)
+            self.decoded[word] = lengths
+        return lengths
+
+    def __contains__(self, word):
+        return (word in self.decoded or
+                isinstance(word, str) and self.find(word) != -1)
+
+    def __len__(self):
+        return self.word_count
+
+    def __iter__(self):
+        for i in range(self.word_count):
+            yield self.word_bytes(i).decode("utf-8")
+
+# the binary dictionary loads much faster, the pickle is the fallback
+DEFAULT_LENGTH_DICTIONARY = ".default_length_dictionary.bin"
+if not os.path.exists(DEFAULT_LENGTH_DICTIONARY):
+    DEFAULT_LENGTH_DICTIONARY = ".default_length_dictionary.pickle"
+
+def open_length_dictionary(path):
+    """Returns the dictionary word -> lengths saved in the file, which
+    is either binary (memory-mapped) or a pickled LengthDictionary."""
+    if is_binary_dictionary(path):
+        return MappedLengthDictionary(path)
+    length_dictionary = LengthDictionary()
+    length_dictionary.load(path)
+    return length_dictionary.dictionary
+
+def convert_dictionary(input_path, output_path):
+    """Converts a pickled LengthDictionary to the binary format and
+    vice versa (only the dictionary, not the frequencies)."""
+    length_dictionary = LengthDictionary()
+    if is_binary_dictionary(input_path):
+        length_dictionary.load_binary(input_path)
+        length_dictionary.save(output_path)
+    else:
+        length_dictionary.load(input_path)
+        length_dictionary.save_binary(output_path)
+    return
+
+
+def make_default_length_dictionary(snapshot_directory=None, jobs=1,
+                                   shard_size=1000, max_iterations=0):
+    """Learns the default length dictionary from perseus_corpus. With
+    snapshot_directory, only files which changed since the last training
+    are scanned (see count_length_frequencies_incrementally). With more
+    than one job, they are scanned in parallel, shard_size lines at once.
+    With max_iterations, the dictionary is trained iteratively (see
+    train_iteratively), neither snapshots nor jobs are used then."""
+    paths = sorted(os.listdir("perseus_corpus"))
     paths = [f"perseus_corpus/{path}" for path in paths]
     ld = LengthDictionary()
-    ld.count_length_frequencies(paths, length_dictionary=None)
+    if max_iterations:
+        ld.train_iteratively(paths, max_iterations)
+        ld.save(".default_length_dictionary.pickle")
+        ld.save_binary(".default_length_dictionary.bin")
+        return
+    if snapshot_directory is not None:
+        ld.count_length_frequencies_incrementally(paths, snapshot_directory,
+                                                  jobs=jobs,
+                                                  shard_size=shard_size)
+    elif jobs > 1:
+        ld.count_length_frequencies_in_parallel(paths, jobs, shard_size)
+    else:
+        ld.count_length_frequencies(paths, length_dictionary=None)
     ld.make_length_dictionary()
     ld.save(".default_length_dictionary.pickle")
+    ld.save_binary(".default_length_dictionary.bin")
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    subparsers = argparser.add_subparsers(dest="command", required=True)
+    train_parser = subparsers.add_parser(
+        "train", help=("learn the default length dictionary from"
+                       " perseus_corpus"))
+    train_parser.add_argument(
+        "--snapshots",
+        help=("directory with frequencies of each file; only files which"
+              " changed since the last training are scanned again"
+              f" (default: {DEFAULT_SNAPSHOT_DIRECTORY})"),
+        default=DEFAULT_SNAPSHOT_DIRECTORY)
+    train_parser.add_argument(
+        "--full", help="scan all files, do not use snapshots",
+        action="store_true")
+    train_parser.add_argument(
+        "-j", "--jobs",
+        help="number of processes scanning in parallel (default: 1)",
+        type=int, default=1)
+    train_parser.add_argument(
+        "--shard-size",
+        help=("number of lines sent to a process at once"
+              " (only with --jobs; default: 1000)"),
+        type=int, default=1000)
+    train_parser.add_argument(
+        "--iterations",
+        help=("rescan verses with the learned dictionary (only those"
+              " whose words got new lengths) until the dictionary stops"
+              " changing, at most this many times (default: 0, i. e. learn"
+              " only from verses unambiguous without the dictionary)"),
+        type=int, default=0)
+    convert_parser = subparsers.add_parser(
+        "convert", help=("convert a pickled length dictionary to"
+                         " the binary format or back"))
+    convert_parser.add_argument("input")
+    convert_parser.add_argument("output")
+    args = argparser.parse_args()
 
-# if __name__ == "__main__":
-#    make_default_length_dictionary()
+    if args.command == "train":
+        if args.jobs < 1 or args.shard_size < 1:
+            argparser.error("--jobs and --shard-size must be at least 1")
+        make_default_length_dictionary(
+            None if args.full else args.snapshots, args.jobs,
+            args.shard_size, args.iterations)
+    elif args.command == "convert":
+        convert_dictionary(args.input, args.output)
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import re
+import glob
+import json
+import time
+import sqlite3
+import argparse
+
+from scan import Verse, assign_meters
+from lengths import DEFAULT_LENGTH_DICTIONARY, open_length_dictionary
+from batch import match_verses, BATCH_SIZE
+from result_cache import (SCANNER_FINGERPRINT, hash_file,
+                          get_dictionary_fingerprint)
+
+DEFAULT_PATTERN_INDEX = ".pattern_index.sqlite"
+DEFAULT_PATHS = sorted(glob.glob("perseus_corpus/*"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    fingerprint TEXT
+);
+CREATE TABLE IF NOT EXISTS lines (
+    id INTEGER PRIMARY KEY,
+    path TEXT,
+    line INTEGER,
+    text TEXT,
+    meter TEXT,
+    scansion_count INTEGER
+);
+CREATE INDEX IF NOT EXISTS lines_path ON lines (path);
+CREATE TABLE IF NOT EXISTS sequences (
+    id INTEGER PRIMARY KEY,
+    meter TEXT,
+    full_sequence TEXT,
+    UNIQUE (meter, full_sequence)
+);
+CREATE TABLE IF NOT EXISTS scansions (
+    line_id INTEGER,
+    sequence_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS scansions_sequence
+    ON scansions (sequence_id, line_id);
+CREATE TABLE IF NOT EXISTS elisions (
+    line_id INTEGER,
+    sequence_id INTEGER,
+    foot INTEGER,
+    position INTEGER
+);
+CREATE INDEX IF NOT EXISTS elisions_foot
+    ON elisions (foot, position, line_id, sequence_id);
+"""
+
+# characters of patterns -> regular expressions over full metrical
+# sequences; the last syllable of a sequence can be "o" (see
+# merge_sequences), which fits both "-" and "u"
+PATTERN_CHARS = {
+    "-": "[-o]",
+    "u": "[uo]",
+    "o": "[-uo]",   # any syllable
+    "?": "[-uo]",
+    "*": "[-uo]*",   # any syllables in the foot
+    "|": r"\|",
+    }
+
+
+def compile_pattern(pattern):
+    """Compiles a pattern of a full metrical sequence (e.g.
+    "-uu|--|*|*|-uu|-o"): "-", "u" are long and short syllables, "o" or
+    "?" any syllable, "*" any syllables within a foot, "|" a foot
+    boundary, and "..." any feet (e.g. "-uu|--|..." matches sequences
+    starting with these two feet)."""
+    regex = ""
+    for i, part in enumerate(pattern.replace(" ", "").split("...")):
+        if i:
+            regex += ".*"
+        for char in part:
+            if char not in PATTERN_CHARS:
+                raise ValueError(f"Unknown character {char!r} in pattern"
+                                 f" {pattern!r}")
+            regex += PATTERN_CHARS[char]
+    return re.compile(regex)
+
+def parse_foot_condition(condition):
+    """Returns (foot, compiled pattern of the foot) of a condition like
+    "5=--" (the fifth foot is a spondee)."""
+    foot, _, pattern = condition.partition("=")
+    if not foot.isdigit() or int(foot) < 1 or not pattern:
+        raise ValueError(f"Wrong foot condition {condition!r},"
+                         " expected e.g. 5=--")
+    return int(foot), compile_pattern(pattern)
+
+def get_elisions(verse, full_sequence):
+    """Returns (foot, position in the foot) of the syllable following
+    each elision in the verse scanned as the full metrical sequence
+    (an elision at the boundary of feet k and k+1 is (k+1, 1))."""
+    positions = [(foot, position)
+                 for foot, syllables in enumerate(full_sequence.split("|"), 1)
+                 for position in range(1, len(syllables)+1)]
+    elisions = []
+    syllable_i = 0
+    for token in verse.tokens:
+        for segment in token.segments:
+            if segment.type_ != "vowel":
+                continue
+            if not segment.elided:
+                syllable_i += 1
+            elif syllable_i < len(positions):
+                elisions.append(positions[syllable_i])
+    return elisions
+
+
+class PatternIndex():
+    """Index of full metrical sequences of scanned corpus lines, stored in
+    SQLite. There are few distinct sequences, so queries are matched
+    against them, and the lines with the matching ones are looked up.
+    Only files which changed since they were indexed are scanned again;
+    the whole index is cleared when the scanner, the length dictionary
+    or the meter changes."""
+
+    def __init__(self, path=DEFAULT_PATTERN_INDEX):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def get_settings(self):
+        return dict(self.connection.execute(
+            "SELECT name, value FROM settings"))
+
+    def clear(self):
+        with self.connection:
+            for table in ("settings", "files", "lines", "sequences",
+                          "scansions", "elisions"):
+                self.connection.execute(f"DELETE FROM {table}")
+
+    def build(self, paths, length_dictionary=None, meter="hexameter",
+              file=sys.stderr):
+        """Scans the files which are not indexed or changed since they
+        were, and indexes their lines."""
+        _, dictionary_fingerprint = get_dictionary_fingerprint(
+            length_dictionary)
+        settings = {"scanner": SCANNER_FINGERPRINT,
+                    "dictionary": dictionary_fingerprint, "meter": meter}
+        if self.get_settings() != settings:
+            self.clear()
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT INTO settings VALUES (?, ?)", settings.items())
+        fingerprints = dict(self.connection.execute(
+            "SELECT path, fingerprint FROM files"))
+        sequence_ids = {(meter, full_sequence): sequence_id
+                        for sequence_id, meter, full_sequence
+                        in self.connection.execute(
+                            "SELECT id, meter, full_sequence"
+                            " FROM sequences")}
+        for path in paths:
+            fingerprint = hash_file(path)
+            if fingerprints.get(path) == fingerprint:
+                print(f"UNCHANGED: {path}", file=file)
+                continue
+            start = time.perf_counter()
+            with open(path, "r") as input_file:
+                lines = list(input_file)
+            with self.connection:
+                self.remove(path)
+                line_count = self.index_lines(path, lines, length_dictionary,
+                                              meter, sequence_ids)
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?)",
+                    (path, fingerprint))
+            print(f"DONE: {path} ({line_count} verses,"
+                  f" {time.perf_counter()-start:.1f} s)", file=file)
+        return
+
+    def index_lines(self, path, lines, length_dictionary, meter,
+                    sequence_ids):
+        """Scans the lines of the file (schemes are matched in batches,
+        see batch.py) and adds them. Returns the number of verses."""
+        line_count = 0
+        pairs = list(assign_meters(lines, meter))
+        for batch_start in range(0, len(pairs), BATCH_SIZE):
+            verses = [Verse(line, length_dictionary=length_dictionary,
+                            meter=line_meter)
+                      for line, line_meter
+                      in pairs[batch_start:batch_start+BATCH_SIZE]]
+            match_verses(verses)
+            for line_number, verse in enumerate(verses, batch_start+1):
+                # skip empty lines or too short lines (with verse numbers)
+                if len(verse.original_form) < 10:
+                    continue
+                line_count += 1
+                line_id = self.connection.execute(
+                    "INSERT INTO lines (path, line, text, meter,"
+                    " scansion_count) VALUES (?, ?, ?, ?, ?)",
+                    (path, line_number, verse.original_form.rstrip("\n"),
+                     verse.meter.name, verse.scansion_count)).lastrowid
+                for full_sequence in verse.full_metrical_sequences:
+                    key = (verse.meter.name, full_sequence)
+                    if key not in sequence_ids:
+                        sequence_ids[key] = self.connection.execute(
+                            "INSERT INTO sequences (meter, full_sequence)"
+                            " VALUES (?, ?)", key).lastrowid
+                    self.connection.execute(
+                        "INSERT INTO scansions VALUES (?, ?)",
+                        (line_id, sequence_ids[key]))
+                    self.connection.executemany(
+                        "INSERT INTO elisions VALUES (?, ?, ?, ?)",
+                        [(line_id, sequence_ids[key], foot, position)
+                         for foot, position
+                         in get_elisions(verse, full_sequence)])
+        return line_count
+
+    def remove(self, path):
+        for table in ("scansions", "elisions"):
+            self.connection.execute(
+                f"DELETE FROM {table} WHERE line_id IN"
+                " (SELECT id FROM lines WHERE path = ?)", (path,))
+        self.connection.execute("DELETE FROM lines WHERE path = ?", (path,))
+        self.connection.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def find_sequences(self, pattern=None, feet=(), meter=None):
+        """Returns ids of the distinct full metrical sequences matching
+        the pattern (see compile_pattern) and the foot conditions (see
+        parse_foot_condition)."""
+        regex = compile_pattern(pattern) if pattern else None
+        feet = [parse_foot_condition(condition) for condition in feet]
+        sequence_ids = []
+        for sequence_id, sequence_meter, full_sequence in \
+                self.connection.execute("SELECT id, meter, full_sequence"
+                                        " FROM sequences"):
+            if meter is not None and sequence_meter != meter:
+                continue
+            if regex is not None and not regex.fullmatch(full_sequence):
+                continue
+            sequence_feet = full_sequence.split("|")
+            if all(foot <= len(sequence_feet)
+                   and foot_regex.fullmatch(sequence_feet[foot-1])
+                   for foot, foot_regex in feet):
+                sequence_ids.append(sequence_id)
+        return sequence_ids
+
+    def find(self, pattern=None, feet=(), elision_boundary=None, meter=None,
+             unambiguous=False, limit=None):
+        """Returns lines with a scansion matching the pattern and
+        the foot conditions (e.g. ["5=--"]), with an elision at
+        the boundary of feet elision_boundary and elision_boundary+1,
+        as dictionaries (one for each matching scansion) in the order of
+        the corpus; with unambiguous, only lines with one scansion."""
+        sequence_ids = self.find_sequences(pattern, feet, meter)
+        if not sequence_ids:
+            return []
+        query = ("SELECT path, line, text, lines.meter, scansion_count,"
+                 " full_sequence FROM scansions"
+                 " JOIN lines ON lines.id = scansions.line_id"
+                 " JOIN sequences ON sequences.id = scansions.sequence_id"
+                 f" WHERE sequence_id IN ({','.join('?'*len(sequence_ids))})")
+        parameters = list(sequence_ids)
+        if elision_boundary is not None:
+            query += (" AND EXISTS (SELECT 1 FROM elisions"
+                      " WHERE foot = ? AND position = 1"
+                      " AND elisions.line_id = scansions.line_id"
+                      " AND elisions.sequence_id = scansions.sequence_id)")
+            parameters.append(elision_boundary+1)
+        if unambiguous:
+            query += " AND scansion_count = 1"
+        query += " ORDER BY line_id, sequence_id"
+        if limit is not None:
+            query += " LIMIT ?"
+            parameters.append(limit)
+        columns = ("path", "line", "text", "meter", "scansion_count",
+                   "full_sequence")
+        return [dict(zip(columns, row))
+                for row in self.connection.execute(query, parameters)]
+
+    def close(self):
+        self.connection.close()
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(
+        description="Index of metrical sequences of scanned lines:"
+                    " find lines by a pattern of their scansion, by feet,"
+                    " or by elisions at foot boundaries.")
+    argparser.add_argument("--index", default=DEFAULT_PATTERN_INDEX,
+                           help=("the index"
+                                 f" (default: {DEFAULT_PATTERN_INDEX})"))
+    subparsers = argparser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser(
+        "build", help=("index the files (only new files and files which"
+                       " changed are scanned)"))
+    build_parser.add_argument("paths", nargs="*",
+                              help="files with verses (default:"
+                                   " perseus_corpus/*)")
+    build_parser.add_argument("-m", "--meter", default="hexameter",
+                              help="meter, as in app.py (default:"
+                                   " hexameter)")
+    build_parser.add_argument("--nolengths",
+                              help="don't try to add unambiguous lengths",
+                              action="store_true")
+    build_parser.add_argument("-d", "--dictionary",
+                              help=("length dictionary; default:"
+                                    f" {DEFAULT_LENGTH_DICTIONARY}"),
+                              default=DEFAULT_LENGTH_DICTIONARY)
+    query_parser = subparsers.add_parser(
+        "query", help="print lines with a matching scansion")
+    query_parser.add_argument(
+        "pattern", nargs="?",
+        help=("pattern of the scansion, e.g. '-uu|--|...': - long, u short,"
+              " ? any syllable, * any syllables in a foot, ... any feet"
+              " (write -- before a pattern starting with -)"))
+    query_parser.add_argument(
+        "-f", "--foot", action="append", default=[],
+        help="condition on a foot, e.g. 5=-- (can be repeated)")
+    query_parser.add_argument(
+        "-e", "--elision-boundary", type=int,
+        help="only lines with an elision between this foot and the next")
+    query_parser.add_argument("-m", "--meter",
+                              help="only scansions in this meter")
+    query_parser.add_argument("--unambiguous", action="store_true",
+                              help="only lines with one scansion")
+    query_parser.add_argument("--limit", type=int,
+                              help="at most this many lines")
+    query_parser.add_argument("--count", action="store_true",
+                              help="print only the number of lines")
+    query_parser.add_argument("--json", action="store_true",
+                              help="print the lines as JSON lines")
+    args = argparser.parse_args()
+
+    if args.command == "build":
+        length_dictionary = None
+        if not args.nolengths:
+            length_dictionary = open_length_dictionary(args.dictionary)
+        index = PatternIndex(args.index)
+        index.build(args.paths or DEFAULT_PATHS, length_dictionary,
+                    args.meter)
+    else:
+        if not os.path.exists(args.index):
+            print(f"ERROR: index {args.index!r} not found"
+                  " (run patterns.py build first)")
+            sys.exit(1)
+        index = PatternIndex(args.index)
+        try:
+            lines = index.find(args.pattern, args.foot,
+                               args.elision_boundary, args.meter,
+                               args.unambiguous, args.limit)
+        except ValueError as error:
+            print(f"ERROR: {error}")
+            sys.exit(1)
+        if args.count:   # lines, not scansions
+            print(len({(line["path"], line["line"]) for line in lines}))
+        for line in ([] if args.count else lines):
+            if args.json:
+                print(json.dumps(line, ensure_ascii=False))
+            else:
+                print(f"{line['path']}:{line['line']}"
+                      f"\t{line['full_sequence']}\t{line['text']}")
+    index.close()
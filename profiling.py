@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+import heapq
+from collections import Counter
+
+import scan
+
+
+# also used by benchmark.py and server.py
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values)-1,
+                             int(fraction*len(sorted_values)))]
+
+
+class Profiler():
+    """Class timing the stages of each Verse. While it is set
+    (scan.set_profiler), every Verse reports to it; it keeps only
+    the totals for each stage and the slowest verses.
+    .stage_seconds: stage -> total time
+    .slowest: the slowest verses as a heap of (seconds, serial number,
+         record), where record is (seconds, line, seconds of each stage,
+         number of "o" in the scheme, number of realizations of the meter
+         fitting the scheme, number of scansions)"""
+
+    def __init__(self, slowest_count=10):
+        self.slowest_count = slowest_count
+        self.verse_count = 0
+        self.seconds = 0.0
+        self.stage_seconds = Counter()
+        self.slowest = []   # heap of (seconds, serial number, record),
+                            # the fastest of them first
+        self.serial = 0   # so that records are never compared
+        self.verse_start = None
+        self.last_lap = None
+        self.verse_stages = None
+
+    def start_verse(self, verse):
+        self.verse_stages = {}
+        self.verse_start = self.last_lap = time.perf_counter()
+
+    def lap(self, stage):
+        """Records the time since the last lap as the time of the stage."""
+        now = time.perf_counter()
+        self.verse_stages[stage] = now - self.last_lap
+        self.last_lap = now
+
+    def finish_verse(self, verse):
+        seconds = self.last_lap - self.verse_start
+        self.verse_count += 1
+        self.seconds += seconds
+        self.stage_seconds.update(self.verse_stages)
+        # a final "o" of merged sequences (see scan.merge_sequences)
+        # stands for two realizations
+        realization_count = sum(2 if sequence.endswith("o") else 1
+                                for sequence in verse.metrical_sequences)
+        self.add_slow((seconds, verse.original_form.rstrip("\n"),
+                       self.verse_stages, verse.scheme.count("o"),
+                       realization_count, verse.scansion_count))
+
+    def add_slow(self, record):
+        """Keeps the record if it is among the slowest."""
+        self.serial += 1
+        if len(self.slowest) < self.slowest_count:
+            heapq.heappush(self.slowest, (record[0], self.serial, record))
+        elif self.slowest and record[0] > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (record[0], self.serial, record))
+
+    def merge(self, other):
+        """Adds the results of another profiler (e.g. from another
+        process)."""
+        self.verse_count += other.verse_count
+        self.seconds += other.seconds
+        self.stage_seconds.update(other.stage_seconds)
+        for _, _, record in other.slowest:
+            self.add_slow(record)
+
+    # only the results are sent between processes
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["verse_stages"] = None
+        return state
+
+    def print_summary(self, file=sys.stderr):
+        """Prints time spent in each stage and the slowest verses."""
+        print(f"PROFILE: {self.verse_count} verses,"
+              f" {self.seconds:.3f} s", file=file)
+        if not self.verse_count:
+            return
+        print("stage\t\t\t\ttotal s\t%\tmean µs", file=file)
+        for stage, seconds in self.stage_seconds.most_common():
+            pct = seconds*100 / self.seconds if self.seconds else 0
+            print(f"{stage:<32}{seconds:.3f}\t{pct:.1f}"
+                  f"\t{seconds*1e6 / self.verse_count:.1f}", file=file)
+        print(f"\nSLOWEST {len(self.slowest)} VERSES:", file=file)
+        for (seconds, line, stages, o_count, realization_count,
+             scansion_count) in [record for _, _, record
+                                 in sorted(self.slowest, reverse=True)]:
+            slowest_stage = max(stages, key=stages.get)
+            print(f"{seconds*1000:.2f} ms ({slowest_stage}"
+                  f" {stages[slowest_stage]*1000:.2f} ms),"
+                  f" {o_count} o, {realization_count} realizations,"
+                  f" {scansion_count} scansions: {line}", file=file)
+        return
+
+
+def start_profiling(slowest_count=10):
+    """Sets a new profiler for all verses and returns it."""
+    profiler = Profiler(slowest_count)
+    scan.set_profiler(profiler)
+    return profiler
+
+def stop_profiling():
+    scan.set_profiler(None)
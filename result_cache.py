@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import itertools
+
+import scan
+from scan import Verse, ScanResult, scan_line
+from lengths import MappedLengthDictionary
+
+DEFAULT_RESULT_CACHE = ".result_cache.sqlite"
+DEFAULT_MAX_ENTRIES = 1_000_000
+CHUNK_SIZE = 256   # lines looked up at once
+
+# results also depend on the code of the scanner, so they are
+# invalidated by any change of it
+with open(scan.__file__, "rb") as file:
+    SCANNER_FINGERPRINT = hashlib.sha256(file.read()).hexdigest()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key BLOB PRIMARY KEY,
+    dictionary_path TEXT,
+    dictionary_fingerprint TEXT,
+    result TEXT,
+    last_used REAL
+);
+CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used);
+CREATE INDEX IF NOT EXISTS results_dictionary
+    ON results (dictionary_path, dictionary_fingerprint);
+"""
+
+
+def hash_file(path):
+    hash_ = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            hash_.update(block)
+    return hash_.hexdigest()
+
+def get_dictionary_fingerprint(length_dictionary):
+    """Returns (path, fingerprint) of the length dictionary: the hash of
+    the file for a binary dictionary, of the words and lengths otherwise
+    (path is then None); ("", "") without a dictionary."""
+    if length_dictionary is None:
+        return "", ""
+    if isinstance(length_dictionary, MappedLengthDictionary):
+        path = os.path.realpath(length_dictionary.path)
+        return path, hash_file(path)
+    hash_ = hashlib.sha256()
+    for word in sorted(length_dictionary):
+        hash_.update(f"{word}\t{length_dictionary[word]}\n".encode("utf-8"))
+    return None, hash_.hexdigest()
+
+def encode_result(result):
+    # the line is not stored, results are shared by all lines with
+    # the same normalized form
+    return json.dumps(result[1:], ensure_ascii=False)
+
+def decode_result(line, encoded):
+    (meter, scheme, metrical_sequences, full_metrical_sequences,
+     scheme_scansion, scansions, status) = json.loads(encoded)
+    return ScanResult(line, meter, scheme, metrical_sequences,
+                      full_metrical_sequences, tuple(scheme_scansion),
+                      [tuple(scansion) for scansion in scansions], status)
+
+
+class ResultCache():
+    """Persistent cache of scansion results (ScanResult) in an SQLite
+    database. Results are keyed by a hash of the normalized line, its
+    meter, unmarked_short, whether lengths are added, the fingerprint of
+    the length dictionary and of the scanner. When there are more than
+    max_entries results, the least recently used are evicted."""
+
+    def __init__(self, path=DEFAULT_RESULT_CACHE,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        # several processes can use the cache at once (app.py --jobs),
+        # threads only one after another (see server.py)
+        self.connection = sqlite3.connect(path, timeout=60,
+                                          check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.entry_count = self.count_entries()
+        # the cache may have been filled with a larger max_entries
+        if self.entry_count > self.max_entries:
+            self.evict()
+        self.fingerprints = {}   # id(dictionary) -> (dictionary, path,
+                                 #                   fingerprint)
+        self.hits = 0
+        self.misses = 0
+
+    def count_entries(self):
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def get_fingerprint(self, length_dictionary):
+        """Returns (path, fingerprint) of the length dictionary (computed
+        once for each dictionary). Results of an older version of
+        a dictionary file are removed."""
+        key = id(length_dictionary)
+        if key not in self.fingerprints:
+            path, fingerprint = get_dictionary_fingerprint(length_dictionary)
+            if path:
+                self.invalidate(path, keep_fingerprint=fingerprint)
+            # the dictionary is kept, so that its id is not reused
+            self.fingerprints[key] = (length_dictionary, path, fingerprint)
+        return self.fingerprints[key][1:]
+
+    def make_key(self, line, meter, unmarked_short, fingerprint):
+        normalized = Verse(line, idle=True)
+        normalized.normalize()
+        key = "\0".join((SCANNER_FINGERPRINT, normalized.normalized_form,
+                         # see Verse.scan_result
+                         str(len(line) < 10), str(meter),
+                         str(bool(unmarked_short)), str(not fingerprint),
+                         fingerprint))
+        return hashlib.sha256(key.encode("utf-8")).digest()
+
+    def get_many(self, keys):
+        """Returns key -> encoded result of the keys which are cached."""
+        found = {}
+        unique_keys = list(set(keys))
+        for i in range(0, len(unique_keys), 500):   # SQLite limits
+            part = unique_keys[i:i+500]
+            found.update(self.connection.execute(
+                "SELECT key, result FROM results WHERE key IN"
+                f" ({','.join('?'*len(part))})", part))
+        if found:
+            # one statement for all the hits instead of one for each
+            found_keys = list(found)
+            now = time.time()
+            with self.connection:
+                for i in range(0, len(found_keys), 500):
+                    part = found_keys[i:i+500]
+                    self.connection.execute(
+                        "UPDATE results SET last_used = ? WHERE key IN"
+                        f" ({','.join('?'*len(part))})", [now, *part])
+        return found
+
+    def put_many(self, entries, dictionary_path, fingerprint):
+        """Stores (key, ScanResult) entries."""
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                [(key, dictionary_path, fingerprint, encode_result(result),
+                  now) for key, result in entries])
+        self.entry_count += len(entries)
+        if self.entry_count > self.max_entries:
+            self.evict()
+
+    def evict(self):
+        """Removes the least recently used results over max_entries
+        (and a tenth more, so that it is not done after every put)."""
+        self.entry_count = self.count_entries()
+        excess = self.entry_count - self.max_entries
+        if excess <= 0:
+            return
+        excess += self.max_entries // 10
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results"
+                " ORDER BY last_used LIMIT ?)", (excess,))
+        self.entry_count = self.count_entries()
+
+    def invalidate(self, dictionary_path=None, keep_fingerprint=None):
+        """Removes results with the dictionary at the path (except those
+        with keep_fingerprint); all results if no path is given."""
+        with self.connection:
+            if dictionary_path is None:
+                self.connection.execute("DELETE FROM results")
+            else:
+                self.connection.execute(
+                    "DELETE FROM results WHERE dictionary_path = ?"
+                    " AND dictionary_fingerprint != ?",
+                    (dictionary_path, keep_fingerprint or ""))
+        self.entry_count = self.count_entries()
+
+    def scan_pairs(self, pairs, length_dictionary=None, unmarked_short=False,
+                   scan_missing=None):
+        """Yields a ScanResult for each (line, meter) pair, like
+        scan_line, but takes the cached results where there are any.
+        scan_missing: function returning ScanResults of a list of pairs
+        (default: scan_line one by one)."""
+        if scan_missing is None:
+            def scan_missing(pairs):
+                return [scan_line(line, length_dictionary, unmarked_short,
+                                  meter) for line, meter in pairs]
+        dictionary_path, fingerprint = self.get_fingerprint(length_dictionary)
+        pairs = iter(pairs)
+        for chunk in iter(lambda: list(itertools.islice(pairs, CHUNK_SIZE)),
+                          []):
+            keys = [self.make_key(line, meter, unmarked_short, fingerprint)
+                    for line, meter in chunk]
+            found = self.get_many(keys)
+            missing = [i for i, key in enumerate(keys) if key not in found]
+            self.hits += len(chunk) - len(missing)
+            self.misses += len(missing)
+            scanned = {}
+            if missing:
+                scanned = dict(zip(missing, scan_missing(
+                    [chunk[i] for i in missing])))
+                # a line can be in the chunk more than once
+                entries = {keys[i]: result for i, result in scanned.items()}
+                self.put_many(list(entries.items()), dictionary_path,
+                              fingerprint)
+            for i, (key, (line, _)) in enumerate(zip(keys, chunk)):
+                if i in scanned:
+                    yield scanned[i]
+                else:
+                    yield decode_result(line, found[key])
+        return
+
+    def print_statistics(self, file=sys.stderr):
+        total = self.hits + self.misses
+        rate = self.hits*100 / total if total else 0
+        print(f"result cache: {self.hits} hits, {self.misses} misses"
+              f" ({rate:.1f} % hits), {self.entry_count} entries",
+              file=file)
+
+    def close(self):
+        self.connection.close()
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(
+        description="Shows or clears the cache of scansion results.")
+    argparser.add_argument("command", choices=("stats", "clear"))
+    argparser.add_argument("path", nargs="?", default=DEFAULT_RESULT_CACHE,
+                           help=("the cache"
+                                 f" (default: {DEFAULT_RESULT_CACHE})"))
+    args = argparser.parse_args()
+    if not os.path.exists(args.path):
+        print(f"ERROR: cache {args.path!r} not found")
+        sys.exit(1)
+    cache = ResultCache(args.path)
+    if args.command == "stats":
+        print(f"{cache.entry_count} results,"
+              f" {os.path.getsize(args.path)/1e6:.1f} MB")
+    else:
+        cache.invalidate()
+        cache.connection.execute("VACUUM")
+    cache.close()
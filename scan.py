@@ -2,6 +2,8 @@
 
 import unicodedata
 import sys
+import re
+from collections import OrderedDict, namedtuple
 
 # characters in non-word tokens
 # -----------------------------
@@ -69,6 +71,9 @@ ADD_BREVE = {
     }
 ADD_BREVE["ë"] = "ĕ"
 ADD_BREVE["y"] = "y̆"
+# breves added by brevize or by the scansion, which are not shown on y
+# (y̆ is shown only where the input or the length dictionary has it)
+ADD_SHOWN_BREVE = dict(ADD_BREVE, y="y")
 
 VOWELS_ACUTE = "áéíóúý"
 CONVERT_ACUTE = {
@@ -83,15 +88,13 @@ STRIP_DIACRITICS.update({
     })
 STRIP_DIACRITICS["y̆"] = "y"
 
+STRIP_DIACRITICS_TABLE = str.maketrans({
+    char: stripped for char, stripped in STRIP_DIACRITICS.items()
+    if len(char) == 1
+    })
+
 def strip_diacritics(text):
-    stripped = ""
-    for char in text:
-        if char in VOWELS_LONG or char in VOWELS_SHORT:
-            stripped += STRIP_DIACRITICS[char]
-        else:
-            stripped += char
-    stripped = stripped.replace("y̆", "y")
-    return stripped
+    return text.translate(STRIP_DIACRITICS_TABLE).replace("y̆", "y")
 
 
 # dictionary to convert ligatures of diphthongs
@@ -108,6 +111,57 @@ CONVERT_LIGATURE = {
 # rather by AE and OE, but meh
 
 
+# translation tables
+# ------------------
+
+# characters expected in the texts, whose translations are prepared in
+# advance: Latin letters with diacritics, combining diacritics (the breve
+# of y̆) and the allowed characters (e.g. dashes and quotes)
+EXPECTED_CODES = (set(range(0x250)) | set(range(0x300, 0x370))
+                  | {ord(char) for char in ALLOWED_CHARS}
+                  | {ord(char.upper()) for char in ALLOWED_CHARS
+                     if len(char.upper()) == 1})
+
+class CharTable(dict):
+    """Translation table for str.translate, prepared for EXPECTED_CODES;
+    other characters are translated by the function each time they are
+    seen, without storing them, so that the table cannot grow."""
+
+    def __init__(self, translate_char, translations=()):
+        super().__init__(translations)
+        self.translate_char = translate_char
+        for code in EXPECTED_CODES:
+            if code not in self:
+                self[code] = translate_char(chr(code))
+
+    def __missing__(self, code):
+        return self.translate_char(chr(code))
+
+# Verse.normalize: acute to macron, ligatures to diphthongs, and removing
+# all but allowed characters, in one pass
+NORMALIZE_TABLE = CharTable(
+    lambda char: char if char.lower() in ALLOWED_CHARS else None)
+for acute, macron in CONVERT_ACUTE.items():
+    NORMALIZE_TABLE[ord(acute)] = macron
+    NORMALIZE_TABLE[ord(acute.upper())] = macron.upper()
+for ligature, replacement in CONVERT_LIGATURE.items():
+    if len(ligature) == 1:
+        NORMALIZE_TABLE[ord(ligature)] = replacement
+# those which are not single characters are replaced before translating
+LIGATURE_SEQUENCES = {
+    ligature: replacement for ligature, replacement
+    in CONVERT_LIGATURE.items() if len(ligature) > 1
+    }
+
+# get_case_mask: the bits of the case mask as "0" and "1"
+CASE_BITS_TABLE = CharTable(lambda char: "1" if char.isupper() else "0")
+
+# Verse.tokenize: each match is either a word or a non-word character;
+# after normalization, all characters but NONWORD_CHARS are word ones
+TOKENIZER = re.compile(
+    f"([^{re.escape(''.join(sorted(NONWORD_CHARS)))}]+)|(.)", re.DOTALL)
+
+
 # ---------------------------------------------
 
 AMBIGUOUS_ELEMENTS = set("ow")
@@ -121,12 +175,25 @@ class ParsingError(Exception):
     pass
 
 class Meter():
-    """Class generating all realizations of a metre from its scheme."""
+    """Class generating all realizations of a metre from its scheme.
+    .sequences: all realizations, syllable lengths -> sequence with
+         feet boundaries
+    .transitions: the scheme compiled into a finite automaton, see
+         compile_automaton
+    .prefix: feet boundaries before the first syllable, which are output
+         before those of the automaton
+    .match: finds realizations fitting a partially known scheme of a verse
+    """
 
-    def __init__(self, scheme):
+    def __init__(self, scheme, name=None):
         self.scheme = scheme
+        self.name = name if name is not None else scheme
         self.sequences = None
+        self.transitions = None
+        self.final_state = None
+        self.prefix = None
         self.generate_metrical_sequences()
+        self.compile_automaton()
 
     # -  short syllable
     # u  long syllable
@@ -161,25 +228,374 @@ class Meter():
         self.sequences = sequences
         return
 
-HEXAMETER = Meter("-w | -w | -w | -w | -uu | -o")
+    # compile the scheme into a nondeterministic finite automaton:
+    # each state is a position in the scheme, each transition consumes
+    # one syllable ("-" or "u") and outputs it (followed by "|" if
+    # a feet boundary comes after it); "w" needs an extra state between
+    # its two short syllables
+    def compile_automaton(self):
+        scheme = "".join([
+            char for char in self.scheme if char in ELEMENTS
+            ])
+        # transitions[state]: list of (syllable, next state, output),
+        # in the same order as generate_metrical_sequences tries them
+        transitions = [[]]
+        state = 0
+        prefix = ""   # no transition leads to the start state
+        for element in scheme:
+            if element == "|" and state == 0:
+                prefix += "|"
+                continue
+            if element == "|":
+                # add the boundary to all transitions leading here
+                for state_transitions in transitions:
+                    for i, (syllable, next_state, output) in enumerate(
+                            state_transitions):
+                        if next_state == state:
+                            state_transitions[i] = (syllable, next_state,
+                                                    output+"|")
+                continue
+            next_state = len(transitions)
+            transitions.append([])
+            if element == "o":
+                transitions[state].append(("-", next_state, "-"))
+                transitions[state].append(("u", next_state, "u"))
+            elif element == "w":
+                middle_state = next_state
+                next_state = len(transitions)
+                transitions.append([])
+                transitions[state].append(("-", next_state, "-"))
+                transitions[state].append(("u", middle_state, "u"))
+                transitions[middle_state].append(("u", next_state, "u"))
+            else:    # unambiguous element
+                transitions[state].append((element, next_state, element))
+            state = next_state
+        self.transitions = transitions
+        self.final_state = state
+        self.prefix = prefix
+        return
+
+    def match(self, scheme):
+        """Input: scheme of a verse made of "-", "u" and "o" (unknown).
+        Returns realizations of the metre fitting the scheme as
+        a dictionary in the same format (and order) as .sequences.
+        Unlike intersecting .sequences with all ways to replace "o"
+        with "-" and "u", it takes one pass over the scheme."""
+        matches = run_automaton(self.transitions, {0: self.final_state},
+                                scheme, {0: self.prefix})
+        return matches.get(self.final_state, {})
+
+
+class MeterGroup():
+    """Class for matching a scheme against several metres at once:
+    their automata are joined into one, so the scheme is still read
+    only once."""
+
+    def __init__(self, meters):
+        self.meters = list(meters)
+        self.transitions = []
+        self.start_states = {}   # start state -> final state
+        self.final_states = {}   # final state -> meter
+        self.prefixes = {}   # start state -> its Meter.prefix
+        for meter in self.meters:
+            offset = len(self.transitions)
+            self.transitions.extend(
+                [(syllable, next_state+offset, output)
+                 for syllable, next_state, output in state_transitions]
+                for state_transitions in meter.transitions
+                )
+            self.start_states[offset] = meter.final_state+offset
+            self.final_states[meter.final_state+offset] = meter
+            self.prefixes[offset] = meter.prefix
+
+    def match(self, scheme):
+        """Returns a dictionary meter -> realizations of the meter fitting
+        the scheme (see Meter.match); only meters with at least one
+        realization are included, in the order they were given."""
+        matches = run_automaton(self.transitions, self.start_states,
+                                scheme, self.prefixes)
+        return {
+            meter: matches[final_state] for final_state, meter
+            in self.final_states.items() if final_state in matches
+            }
+
+
+# the automaton of Meter.compile_automaton is run with all its start
+# states at once (to match several meters joined by MeterGroup)
+def run_automaton(transitions, start_states, scheme, prefixes):
+    """Input: transitions of the automaton, start_states -- dictionary
+    start state -> its final state, scheme of a verse, prefixes --
+    dictionary start state -> output before the first syllable.
+    Returns a dictionary final state -> realizations fitting the scheme
+    (syllable lengths -> sequence with feet boundaries)."""
+    # reachable[i]: states the automaton can be in after i syllables
+    reachable = [set(start_states)]
+    for syllable in scheme:
+        states = set()
+        for state in reachable[-1]:
+            for transition_syllable, next_state, _ in transitions[state]:
+                if syllable == "o" or syllable == transition_syllable:
+                    states.add(next_state)
+        if not states:
+            return {}
+        reachable.append(states)
+    final_states = reachable[-1].intersection(start_states.values())
+    if not final_states:
+        return {}
+
+    # keep only the states from which a final state can be reached
+    alive = [None]*len(reachable)
+    alive[-1] = final_states
+    for i in range(len(scheme)-1, -1, -1):
+        alive[i] = {
+            state for state in reachable[i]
+            if any(next_state in alive[i+1]
+                   and scheme[i] in ("o", transition_syllable)
+                   for transition_syllable, next_state, _
+                   in transitions[state])
+            }
+
+    # read off the outputs of all accepting paths
+    matches = {}
+    def add_sequence(state, i, sequence, sequence_lengths, final_state):
+        if i == len(scheme):
+            if state == final_state:
+                matches.setdefault(final_state, {})[sequence_lengths] = (
+                    sequence)
+            return
+        for transition_syllable, next_state, output in transitions[state]:
+            if (
+                next_state in alive[i+1] and
+                scheme[i] in ("o", transition_syllable)
+            ):
+                add_sequence(next_state, i+1, sequence+output,
+                             sequence_lengths+transition_syllable,
+                             final_state)
+    for start_state, final_state in start_states.items():
+        if start_state in alive[0]:
+            add_sequence(start_state, 0, prefixes[start_state], "",
+                         final_state)
+    return matches
+
+
+# registry of named meters
+# ------------------------
+
+# each meter is compiled only once and shared by all verses
+# (user-supplied schemes which are not registered: see METER_CACHE)
+METERS = {}
+
+# limits of user-supplied schemes: the number of realizations doubles
+# with each ambiguous element
+MAX_SCHEME_ELEMENTS = 32
+MAX_AMBIGUOUS_ELEMENTS = 12
+
+def register_meter(name, scheme):
+    """Compiles the scheme (in the notation of Meter) and registers it
+    under the name. Returns the meter."""
+    meter = Meter(scheme, name=name)
+    METERS[name] = meter
+    return meter
+
+def get_meter(meter):
+    """Input: a Meter, name of a registered meter, or a scheme.
+    Returns the compiled meter (schemes are compiled only once)."""
+    if isinstance(meter, Meter):
+        return meter
+    if meter in METERS:
+        return METERS[meter]
+    compiled = METER_CACHE.get(meter)
+    if compiled is None:
+        check_scheme(meter)
+        compiled = Meter(meter)
+        METER_CACHE.put(meter, compiled)
+    return compiled
+
+def check_scheme(scheme):
+    """Raises ValueError if the scheme is not a sensible scheme of a meter
+    (see Meter): it must have at least one syllable, and at most
+    MAX_SCHEME_ELEMENTS elements, MAX_AMBIGUOUS_ELEMENTS of them
+    ambiguous."""
+    if not scheme or not set(scheme) <= ELEMENTS | {" "}:
+        raise ValueError(f"Unknown meter: {scheme!r}")
+    elements = [char for char in scheme if char in ELEMENTS - {"|"}]
+    if not elements:
+        raise ValueError(f"Meter {scheme!r} has no syllables")
+    if (
+        len(elements) > MAX_SCHEME_ELEMENTS or
+        sum(element in AMBIGUOUS_ELEMENTS for element in elements)
+            > MAX_AMBIGUOUS_ELEMENTS
+        ):
+        raise ValueError(f"Meter {scheme!r} is too long (at most"
+                         f" {MAX_SCHEME_ELEMENTS} elements, of them"
+                         f" {MAX_AMBIGUOUS_ELEMENTS} ambiguous)")
+
+# group of all registered meters for the auto mode (recompiled
+# only when a new meter is registered)
+_meter_group = None
+
+def get_meter_group():
+    global _meter_group
+    if _meter_group is None or _meter_group.meters != list(METERS.values()):
+        _meter_group = MeterGroup(METERS.values())
+    return _meter_group
+
+# meters alternating line by line
+COUPLETS = {
+    "elegiac": ("hexameter", "pentameter"),
+    }
 
-def restore_cases(lowercase_form, original_cases):
-    restored = ""
-    for char, case in zip(lowercase_form, original_cases):
-        if case == "U":
-            restored += char.upper()
+def assign_meters(lines, meter):
+    """Yields (line, meter) for each line. For couplets (e.g. "elegiac"),
+    the meters alternate; lines too short to be a verse (empty lines,
+    verse numbers) are skipped in the alternation."""
+    if meter in COUPLETS:
+        meters = COUPLETS[meter]
+        i = 0
+        for line in lines:
+            yield line, meters[i % len(meters)]
+            if len(line) >= 10:
+                i += 1
+    else:
+        for line in lines:
+            yield line, meter
+
+HEXAMETER = register_meter("hexameter", "-w | -w | -w | -w | -uu | -o")
+PENTAMETER = register_meter("pentameter", "-w | -w | - | -uu | -uu | o")
+
+# if two sequences differ only in the last element, which is
+# free in hexameter, merge them together
+def merge_sequences(sequences):
+    merged_sequences = []
+    i = 0
+    # compare the current sequence with the next
+    while i < len(sequences)-1:
+        this, next_ = sequences[i], sequences[i+1]
+        if len(this) == len(next_) and this[:-1] == next_[:-1]:
+            merged_sequences.append(this[:-1]+"o")
+            i += 2
+        else:
+            merged_sequences.append(this)
+            i += 1
+    # if the antepenultimate sequence wasn't the same as
+    # the last one, add it (this covers also the case when there
+    # is only one sequence)
+    if i == len(sequences)-1:
+        merged_sequences.append(sequences[-1])
+    return merged_sequences
+
+# result of matching a scheme with the meter, as stored in SCHEME_CACHE:
+# (meter, metrical sequences, full metrical sequences), where sequences
+# are the realizations of the meter fitting the scheme (see Meter.match)
+def make_match_result(meter, sequences):
+    return (meter, merge_sequences(sorted(sequences)),
+            merge_sequences(list(sequences.values())))
+
+
+class LRUCache():
+    """Bounded cache which drops the least recently used entries,
+    shared by all verses in the process.
+    .hits, .misses: counters since the last clear
+    .maxsize: maximal number of entries, 0 disables the cache"""
+
+    def __init__(self, name, maxsize):
+        self.name = name
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Returns the cached result or None."""
+        if self.maxsize <= 0:
+            return None
+        result = self.entries.get(key)
+        if result is None:
+            self.misses += 1
         else:
-            restored += char
-    return restored
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        if self.maxsize <= 0:
+            return
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)   # the least recently used
+        return
+
+    def resize(self, maxsize):
+        """Sets the maximal size (0 disables the cache)."""
+        self.maxsize = maxsize
+        while len(self.entries) > max(maxsize, 0):
+            self.entries.popitem(last=False)
+        return
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+        return
 
+    def print_statistics(self):
+        """Prints number of hits, misses and entries to stderr."""
+        lookups = self.hits + self.misses
+        hit_pct = self.hits*100 // lookups if lookups else 0
+        print(f"{self.name}: {self.hits} hits, {self.misses} misses"
+              f" ({hit_pct} %), {len(self.entries)} entries",
+              file=sys.stderr)
+        return
 
+# matching results: (scheme, meter) -> (meter, metrical sequences, full
+# metrical sequences); distinct schemes are much rarer than lines,
+# so most verses skip matching entirely
+SCHEME_CACHE = LRUCache("scheme cache", 10000)
+
+# compiled user-supplied schemes of meters (see get_meter)
+METER_CACHE = LRUCache("meter cache", 100)
+
+# analyses of word forms: (lowercase form, type, unmarked_short,
+# length dictionary) -> segments without cases, see Token.analyse
+WORD_CACHE = LRUCache("word cache", 100000)
+
+
+# cases are stored as bitmasks: bit i is set if the i-th character
+# is upper-case
+def restore_cases(lowercase_form, case_mask):
+    if not case_mask:
+        return lowercase_form
+    # bits beyond the form are ignored
+    case_mask &= (1 << len(lowercase_form)) - 1
+    if case_mask == 1:   # the most common case, capitalized
+        return lowercase_form[:1].upper() + lowercase_form[1:]
+    chars = list(lowercase_form)
+    while case_mask:
+        i = (case_mask & -case_mask).bit_length() - 1   # the lowest bit
+        chars[i] = chars[i].upper()
+        case_mask &= case_mask - 1
+    return "".join(chars)
+
+def get_case_mask(form):
+    if not form:
+        return 0
+    return int(form[::-1].translate(CASE_BITS_TABLE), 2)
+
+
+# type_, subtype, length and coda of segments are always one of a few
+# string constants, which Python shares, so they cost no more than
+# a small integer would
 class Segment():
     """Class for phonological units (defined with respect to scansion)."""
 
-    def __init__(self, lowercase_form="", original_case="", type_=None,
+    __slots__ = ("lowercase_form", "case_mask", "type_", "subtype",
+                 "length", "coda", "elided")
+
+    def __init__(self, lowercase_form="", case_mask=0, type_=None,
                  / , subtype=None, length=None):
         self.lowercase_form = lowercase_form
-        self.original_case = original_case
+        self.case_mask = case_mask
         self.type_ = type_
         self.subtype = subtype
         self.length = length
@@ -188,140 +604,159 @@ class Segment():
         self.coda = None    # only for vowels
         self.elided = None
 
+    def copy(self):
+        segment = Segment.__new__(Segment)
+        segment.lowercase_form = self.lowercase_form
+        segment.case_mask = self.case_mask
+        segment.type_ = self.type_
+        segment.subtype = self.subtype
+        segment.length = self.length
+        segment.coda = self.coda
+        segment.elided = self.elided
+        return segment
+
+# sentinel for the vowel before the first one
+NO_SEGMENT = Segment()
+
+
+# compiled segmenter
+# ------------------
+
+def char_class(chars):
+    return f"[{re.escape(''.join(sorted(chars)))}]"
+
+def words_with(pair, words):
+    """Pattern matching the pair only where it is in one of the words
+    (the whole word, wherever the pair is in it)."""
+    alternatives = []
+    for word in sorted(words):
+        i = word.find(pair)
+        while i != -1:
+            alternatives.append(f"(?<=\\A{re.escape(word[:i])})"
+                                f"{re.escape(pair)}"
+                                f"(?={re.escape(word[i+len(pair):])}\\Z)")
+            i = word.find(pair, i+1)
+    return "|".join(alternatives)
+
+# one alternative for each case of testing.segmentize_reference, in the same
+# order, so that the first which matches at each position wins
+VOWEL = char_class(VOWELS)
+SEGMENT_PATTERNS = (
+    ("diphthong", "|".join(sorted(DIPHTHONGS)
+                           + [words_with("eu", EU_WORDS),
+                              words_with("ui", UI_WORDS)])),
+    ("nasal", f"{VOWEL}m\\Z"),
+    # i before a vowel initially or after a prefix
+    ("consonant_i", "(?:\\A|" + "|".join(
+        [f"(?<=\\A{re.escape(prefix)})" for prefix in sorted(PREFIXES)])
+        + f")i(?={VOWEL})"),
+    # i between two vowels, but not after qu, (n)gu
+    ("double_i", f"(?<={VOWEL})(?<!qu)(?<!ngu)[ij](?={VOWEL})"),
+    ("qu", "qu"),
+    ("gu", f"(?<=n)gu(?={VOWEL})"),
+    ("double", "[xz]"),
+    ("h", "h"),
+    ("short_y", "y̆"),
+    ("long", char_class(VOWELS_LONG)),
+    ("short", char_class(VOWELS_SHORT)),
+    ("unknown", char_class(VOWELS_UNKNOWN)),
+    ("consonant", char_class(CONSONANTS)),
+    ("error", "."),
+    )
+SEGMENTER = re.compile("|".join([f"(?P<{name}>{pattern})" for name, pattern
+                                 in SEGMENT_PATTERNS]), re.DOTALL)
+
+def cannot_segment(char):
+    raise ValueError(f"Cannot analyse this character: {char!r}")
+
+# functions making the segments of each match of SEGMENTER
+MAKE_SEGMENTS = {
+    "diphthong": lambda form: [Segment(form, 0, "vowel",
+                                       subtype="diphthong")],
+    "nasal": lambda form: [Segment(form, 0, "vowel", subtype="nasal")],
+    "consonant_i": lambda form: [Segment(form, 0, "consonant")],
+    "double_i": lambda form: [Segment("", 0, "consonant"),
+                              Segment(form, 0, "consonant")],
+    "qu": lambda form: [Segment(form, 0, "consonant")],
+    "gu": lambda form: [Segment(form, 0, "consonant")],
+    "double": lambda form: [Segment("", 0, "consonant"),
+                            Segment(form, 0, "consonant")],
+    "h": lambda form: [Segment(form, 0, "h")],
+    "short_y": lambda form: [Segment(form, 0, "vowel", subtype="monophthong",
+                                     length="short")],
+    "long": lambda form: [Segment(form, 0, "vowel", subtype="monophthong",
+                                  length="long")],
+    "short": lambda form: [Segment(form, 0, "vowel", subtype="monophthong",
+                                   length="short")],
+    "unknown": lambda form: [Segment(form, 0, "vowel",
+                                     subtype="monophthong",
+                                     length="unknown")],
+    "consonant": lambda form: [Segment(form, 0, "consonant")],
+    "error": cannot_segment,
+    }
+
 
 class Token():
     """Class for words or punctuation (including space) or digits
     (for verse numbers)"""
 
+    __slots__ = ("original_form", "case_mask", "lowercase_form", "type_",
+                 "length_dictionary", "segments")
+
     def __init__(self, original_form="", type_=None,
                  length_dictionary=None):
         self.original_form = original_form
-        self.original_cases = None
+        self.case_mask = None
         self.lowercase_form = None
         self.type_ = type_
         self.length_dictionary = length_dictionary
         self.segments = None
         self.normalize_cases()
 
+    # a copy with its own segments, so that changing them (e.g. by
+    # add_lengths or elision) does not change this token; without
+    # segments if they are to be analysed again (see Verse.fork)
+    def copy(self, segments=True):
+        token = Token.__new__(Token)   # cases are already normalized
+        token.original_form = self.original_form
+        token.case_mask = self.case_mask
+        token.lowercase_form = self.lowercase_form
+        token.type_ = self.type_
+        token.length_dictionary = self.length_dictionary
+        token.segments = (None if self.segments is None or not segments
+                          else [segment.copy() for segment in self.segments])
+        return token
+
     # to make various comparisons easier, remember the original case for
     # each character, and turn them lower-case
     def normalize_cases(self):
-        original_cases = ""
-        for char in self.original_form:
-            if char.isupper():
-                original_cases += "U"
-            else:
-                original_cases += "L"
-        self.original_cases = original_cases
-        self.lowercase_form = self.original_form.lower()
+        lowercase_form = self.original_form.lower()
+        if lowercase_form == self.original_form:
+            self.case_mask = 0
+        else:
+            self.case_mask = get_case_mask(self.original_form)
+        # the same forms are shared by all tokens
+        self.lowercase_form = sys.intern(lowercase_form)
         return
 
     # split the token into segments, roughly phonemes
     def segmentize(self):
-        segments = []
         # parse non-word segments (punctuation, numbers) as one segment
-        if self.type_ != "word":   
-            segments.append(Segment(self.lowercase_form,
-                                    self.original_cases, "other"))
-        # for word segments:
-        else:
-            # to avoid checking whether we are at the beginning or
-            # the end of the word, add sentinel spaces
-            form = f" {self.lowercase_form} "
-            cases = f" {self.original_cases} "
-            i = 1   # id of the current character in the token
-            while form[i] != " ":
-                prev, char, next_ = form[i-1:i+2]
-                char_case, next_case = cases[i:i+2]
-                new_i = i+1
-
-                # diphthongs
-                if (
-                    (char+next_ in DIPHTHONGS) or
-                    (char+next_ == "eu" and form[1:-1] in EU_WORDS) or
-                    (char+next_ == "ui" and form[1:-1] in UI_WORDS)
-                ):
-                    new = [Segment(char+next_, char_case+next_case,
-                                   "vowel", subtype = "diphthong")]
-                    new_i += 1
-
-                # final nasal vowels
-                elif char in VOWELS and form[i+1:] == "m ":
-                    new = [Segment(char+next_, char_case+next_case,
-                                   "vowel", subtype = "nasal")]
-                    new_i += 1
-
-                # i as a consonant
-                # before a vowel initially or after a prefix 
-                elif (
-                    char == "i" and next_ in VOWELS and
-                    (i == 1 or form[1:i] in PREFIXES)
-                ):   
-                    new = [Segment("i", char_case, "consonant")]
-                # i as two consonants between two vowels
-                elif (
-                    (char == "i" or char == "j") and
-                    prev in VOWELS and next_ in VOWELS and
-                    form[i-2:i] != "qu" and form[i-3:i] != "ngu"
-                    # qu, (n)gu is a consonant, not a vowel
-                ):   
-                    new = [Segment("", "", "consonant"),
-                           Segment(char, char_case, "consonant")]
-                # otherwise i is a monophthong and is treated later
-
-                # qu is a single consonant
-                elif char+next_ == "qu":
-                    new = [Segment("qu", char_case+next_case,
-                                   "consonant")]
-                    new_i += 1
-                # gu after n and before a vowel is a single consonant
-                elif prev+char+next_ == "ngu" and form[i+2] in VOWELS:
-                    new = [Segment("gu", char_case+next_case,
-                                   "consonant")]
-                    new_i += 1
-
-                # x (= cs), z (= zz) are two consonants
-                elif char == "x" or char == "z":
-                    new = [Segment("", "", "consonant"),
-                           Segment(char, char_case, "consonant")]
-
-                # h never causes length by position and does not
-                # prevent elision, so it gets a special type
-                elif char == "h":
-                    new = [Segment("h", char_case, "h")]
-                
-                # y with breve: there is no single character for it in
-                # Unicode, so it was not normalized, and has to be
-                # treated specially
-                elif char+next_ == "y̆":
-                    new = [Segment("y̆", char_case+next_case,
-                                   "vowel", subtype="monophthong",
-                                   length="short")]
-                    new_i += 1
-
-                # other vowels
-                elif char in VOWELS:
-                    if char in VOWELS_LONG:
-                        length = "long"
-                    elif char in VOWELS_SHORT:
-                        length = "short"
-                    else:
-                        length = "unknown"
-                    new = [Segment(char, char_case, "vowel",
-                                   subtype="monophthong",
-                                   length=length)]
-
-                # other consonants
-                elif char in CONSONANTS:
-                    new = [Segment(char, char_case, "consonant")]
-
-                else:
-                    raise ValueError("Cannot analyse this character:"
-                                     + f" {char!r}")
-
-                segments.extend(new)
-                i = new_i
-
+        if self.type_ != "word":
+            self.segments = [Segment(self.lowercase_form,
+                                     self.case_mask, "other")]
+            return
+        # for word segments, see SEGMENT_PATTERNS
+        segments = []
+        for match in SEGMENTER.finditer(self.lowercase_form):
+            segments.extend(MAKE_SEGMENTS[match.lastgroup](match.group()))
+        # each segment spans as many characters as its form has
+        if self.case_mask:
+            i = 0
+            for segment in segments:
+                span = len(segment.lowercase_form)
+                segment.case_mask = (self.case_mask >> i) & ((1 << span)-1)
+                i += span
         self.segments = segments
         return
 
@@ -333,7 +768,7 @@ class Token():
                 segment.length == "unknown"
                 ):
                 segment.length = "short"
-                segment.lowercase_form = ADD_BREVE[
+                segment.lowercase_form = ADD_SHOWN_BREVE[
                     segment.lowercase_form]
         return
 
@@ -355,12 +790,62 @@ class Token():
                         if segment.length == "long":
                             segment.lowercase_form = ADD_MACRON[segment.lowercase_form]
                         elif segment.length == "short":
-                            if segment.lowercase_form == "y":
-                                segment.original_case += "L"
                             segment.lowercase_form = ADD_BREVE[segment.lowercase_form]
                     monophthong_i += 1
         return
 
+    # segmentize + brevize or add_lengths; the result depends only on
+    # the lowercase form, so it is cached and only the cases are restored
+    # for each token (each token gets its own segments, because elision
+    # and codas change them)
+    def analyse(self, unmarked_short=False):
+        """Segmentizes the token and adds lengths (brevizes if
+        unmarked_short, otherwise adds lengths from the length dictionary
+        if there is one)."""
+        add_lengths = not unmarked_short and bool(self.length_dictionary)
+        if WORD_CACHE.maxsize <= 0:
+            self.segmentize()
+            if unmarked_short:
+                self.brevize()
+            elif add_lengths:
+                self.add_lengths()
+            return
+        key = (self.lowercase_form, self.type_, unmarked_short,
+               id(self.length_dictionary) if add_lengths else None)
+        template = WORD_CACHE.get(key)
+        if template is None:
+            template = self.make_template(unmarked_short, add_lengths)
+            # keep the dictionary alive so that its id cannot be reused
+            WORD_CACHE.put(key, (template, self.length_dictionary))
+        else:
+            template = template[0]
+
+        segments = []
+        case_mask = self.case_mask
+        for form, span, type_, subtype, length in template:
+            segments.append(Segment(form, case_mask & ((1 << span)-1),
+                                    type_, subtype=subtype, length=length))
+            case_mask >>= span
+        self.segments = segments
+        return
+
+    # segments of the lowercase form: for each of them its form, number
+    # of characters of the token it spans, type, subtype and length
+    def make_template(self, unmarked_short, add_lengths):
+        token = Token(self.lowercase_form, self.type_,
+                      self.length_dictionary)
+        token.segmentize()
+        spans = [len(segment.lowercase_form) for segment in token.segments]
+        if unmarked_short:
+            token.brevize()
+        elif add_lengths:
+            token.add_lengths()
+        return tuple(
+            (sys.intern(segment.lowercase_form), span,
+             segment.type_, segment.subtype, segment.length)
+            for segment, span in zip(token.segments, spans)
+            )
+
     def print_segments(self):
         """Prints segments of a token divided by |. Vowels are in upper case."""
         if self.segments == None:
@@ -380,46 +865,214 @@ class Token():
         return
 
 
+# object timing the stages of each Verse (see profiling.Profiler),
+# None if profiling is off
+PROFILER = None
+
+def set_profiler(profiler):
+    global PROFILER
+    PROFILER = profiler
+
+
 class Verse():
     """Class for scanning verse.
+    .meter: the meter the verse is scanned in (a Meter, name of
+         a registered meter or a scheme, hexameter by default); with
+         meter="auto", all registered meters are tried at once and
+         .meter is the first one which fits
     .full_metrical_sequences: sequences of syllable lengths with feet
-         boundaries fitting the hexameter scheme
+         boundaries fitting the scheme of the meter
     .metrical_sequences: the same without feet boundaries
     .scansions: for each metrical sequence, text of the verse and
          sequence with elements aligned with vowels
+    .candidate_sequences: all ways to fill in the scheme (the old,
+         exponential way of matching kept as a reference for
+         the automaton in Meter.match); generated on first access unless
+         enumerate_candidates=True
     .print_scansions: prints all scansions, if the verse cannot be scanned,
          prints the aligned scheme
+    .fork: the same line under other options, without normalizing and
+         tokenizing it again
     """
 
     def __init__(self, original_form, / ,
                  length_dictionary=None, unmarked_short=False,
-                 idle=False):
+                 idle=False, enumerate_candidates=False,
+                 meter="hexameter"):
         self.original_form = original_form
         self.length_dictionary = length_dictionary
+        self.auto_meter = meter == "auto"
+        self._meter = HEXAMETER if self.auto_meter else get_meter(meter)
+        self.enumerate_candidates = enumerate_candidates
         self.normalized_form = None
         self.tokens = None
         self.scheme = None
-        self.candidate_sequences = None
-        self.metrical_sequences = None   # only syllable lengths
-        self.full_metrical_sequences = None   # + feet boundaries
-        self.scansions = None
-        self.scansion_count = None
+        self._candidate_sequences = None
+        self._metrical_sequences = None   # only syllable lengths
+        self._full_metrical_sequences = None   # + feet boundaries
+        self._scansions = None
+        self._scansion_count = None
+        # matching the scheme and scanning are done only when their
+        # results are needed (e.g. training needs no scansions)
+        self.matching_pending = False
+        self.scanning_pending = False
         if not idle:   # for debugging and showing how it works
+            # PROFILER is None unless profiling is on (see profiling.py)
+            profiler = PROFILER
+            if profiler is not None:
+                profiler.start_verse(self)
             self.normalize()
+            if profiler is not None:
+                profiler.lap("normalize")
             self.tokenize()
+            if profiler is not None:
+                profiler.lap("tokenize")
             for token in self.tokens:
-                token.segmentize()
-                if unmarked_short:
-                    token.brevize()
                 # only add lengths if the input is not fully macronized
-                elif self.length_dictionary:
-                    token.add_lengths()
+                token.analyse(unmarked_short)
+            if profiler is not None:
+                profiler.lap("analyse")
             self.elide()
+            if profiler is not None:
+                profiler.lap("elide")
             self.analyse_codas()
+            if profiler is not None:
+                profiler.lap("analyse_codas")
             self.make_scheme()
+            if profiler is None:
+                self.matching_pending = True
+                self.scanning_pending = True
+                return
+            # when profiling, all stages are timed right away
+            profiler.lap("make_scheme")
+            if enumerate_candidates:
+                self.generate_candidate_sequences()
+                profiler.lap("generate_candidate_sequences")
+                self.find_metrical_sequences()
+                profiler.lap("find_metrical_sequences")
+            else:
+                self.match_metrical_sequences()
+                profiler.lap("match_metrical_sequences")
+            self.scan()
+            profiler.lap("scan")
+            profiler.finish_verse(self)
+
+    # lazily computed results
+    # -----------------------
+
+    def run_matching(self):
+        self.matching_pending = False
+        if self.enumerate_candidates:
             self.generate_candidate_sequences()
             self.find_metrical_sequences()
-            self.scan()
+        else:
+            self.match_metrical_sequences()
+        return
+
+    def run_scanning(self):
+        self.scanning_pending = False
+        self.scan()
+        return
+
+    @property
+    def meter(self):
+        # with meter="auto", the meter is known only after matching
+        if self.matching_pending and self.auto_meter:
+            self.run_matching()
+        return self._meter
+
+    @meter.setter
+    def meter(self, meter):
+        self._meter = meter
+
+    @property
+    def candidate_sequences(self):
+        # only matching with enumerate_candidates=True needs them
+        if self._candidate_sequences is None and self.scheme is not None:
+            self.generate_candidate_sequences()
+        return self._candidate_sequences
+
+    @candidate_sequences.setter
+    def candidate_sequences(self, sequences):
+        self._candidate_sequences = sequences
+
+    @property
+    def metrical_sequences(self):
+        if self.matching_pending:
+            self.run_matching()
+        return self._metrical_sequences
+
+    @metrical_sequences.setter
+    def metrical_sequences(self, sequences):
+        self._metrical_sequences = sequences
+
+    @property
+    def full_metrical_sequences(self):
+        if self.matching_pending:
+            self.run_matching()
+        return self._full_metrical_sequences
+
+    @full_metrical_sequences.setter
+    def full_metrical_sequences(self, sequences):
+        self._full_metrical_sequences = sequences
+
+    @property
+    def scansions(self):
+        if self.scanning_pending:
+            self.run_scanning()
+        return self._scansions
+
+    @scansions.setter
+    def scansions(self, scansions):
+        self._scansions = scansions
+
+    @property
+    def scansion_count(self):
+        # there is a scansion for each full metrical sequence, so they
+        # do not have to be rendered to be counted
+        if self.scanning_pending:
+            return len(self.full_metrical_sequences)
+        return self._scansion_count
+
+    @scansion_count.setter
+    def scansion_count(self, scansion_count):
+        self._scansion_count = scansion_count
+
+    # the stages after the tokens are analysed (as in __init__), for
+    # verses whose tokens were analysed otherwise (see fork)
+    def finish(self):
+        self.elide()
+        self.analyse_codas()
+        self.make_scheme()
+        self.matching_pending = True
+        self.scanning_pending = True
+        return
+
+    # normalization and tokenization do not depend on the options, and
+    # the tokens keep their forms and cases through elision, so the fork
+    # only analyses the words again (taking their segments from
+    # WORD_CACHE); the other tokens never change and are shared
+    def fork(self, length_dictionary=None, unmarked_short=False,
+             enumerate_candidates=False, meter="hexameter"):
+        """Returns the verse as Verse(original_form, ...) with the same
+        options would be, reusing the tokens of this verse."""
+        if self.tokens is None:
+            raise ParsingError(f"The verse {self.original_form!r} is"
+                               + " not tokenized yet.")
+        verse = Verse(self.original_form, length_dictionary=length_dictionary,
+                      idle=True, enumerate_candidates=enumerate_candidates,
+                      meter=meter)
+        verse.normalized_form = self.normalized_form
+        tokens = []
+        for token in self.tokens:
+            if token.type_ == "word":
+                token = token.copy(segments=False)
+                token.length_dictionary = length_dictionary
+                token.analyse(unmarked_short)
+            tokens.append(token)
+        verse.tokens = tokens
+        verse.finish()
+        return verse
 
     # merge combining diacritics with the preceding character (except
     # for y+breve), convert diphtong ligatures, and strip everything but
@@ -432,21 +1085,12 @@ class Verse():
         normalized = unicodedata.normalize("NFC", normalized)
 
         # convert vowels with acute (Czech way of marking length)
-        # to vowels with macron (Latin way)
-        for acute, macron in CONVERT_ACUTE.items():
-            normalized = normalized.replace(acute, macron)
-            normalized = normalized.replace(acute.upper(),
-                                            macron.upper())
-        
-        # convert ligatures for ae, oe
-        for ligature, replacement in CONVERT_LIGATURE.items():
-            normalized = normalized.replace(ligature, replacement)
-        
-        # remove all but allowed characters
-        normalized = [
-            char for char in normalized if char.lower() in ALLOWED_CHARS
-            ]
-        normalized = "".join(normalized)
+        # to vowels with macron (Latin way), convert ligatures for ae, oe,
+        # and remove all but allowed characters (see NORMALIZE_TABLE)
+        for sequence, replacement in LIGATURE_SEQUENCES.items():
+            if sequence in normalized:
+                normalized = normalized.replace(sequence, replacement)
+        normalized = normalized.translate(NORMALIZE_TABLE)
         
         self.normalized_form = normalized
         return
@@ -458,23 +1102,12 @@ class Verse():
     # is then parsed as multiple words (which can then lead to an
     # unwanted elision etc.)
     def tokenize(self):
-        # add sentinel space so the last word is added (word tokens are
-        # added when a non-word character is encountered)
-        verse = f"{self.normalized_form} "
-        tokens = []
-        word = ""
-        for char in verse:
-            if char.lower() not in WORD_CHARS:
-                # unless the previous character was not a part of
-                # a word, add the previous word as a word token
-                if word != "":
-                    tokens.append(Token(word, "word", self.length_dictionary))
-                    word = ""   # and initialize a new word
-                # and add this character as a non-word token
-                tokens.append(Token(char, "other", self.length_dictionary))    
-            else:   # the current word token continues
-                word += char
-        self.tokens = tokens[:-1]   # without the sentinel
+        length_dictionary = self.length_dictionary
+        self.tokens = [
+            Token(word, "word", length_dictionary) if word
+            else Token(char, "other", length_dictionary)
+            for word, char in TOKENIZER.findall(self.normalized_form)
+            ]
         return
 
     # elide -- for elided segments, set elided as True, and enclose
@@ -512,8 +1145,7 @@ class Verse():
                     next_segments[0].lowercase_form = (
                         f"({next_segments[0].lowercase_form})")
                     next_segments[0].elided = True
-                    next_segments[0].original_case = (
-                        f"L{next_segments[0].original_case}L")
+                    next_segments[0].case_mask <<= 1   # for "("
                 
                 # otherwise the final vowel (+ initial h) is
                 else:
@@ -521,18 +1153,15 @@ class Verse():
                     # and elision always starts there
                     segments[-1].lowercase_form = (
                         f"({segments[-1].lowercase_form}")
-                    segments[-1].original_case = (
-                        f"L{segments[-1].original_case}")
+                    segments[-1].case_mask <<= 1   # for "("
                     segments[-1].elided = True
                     
                     # where the elision ends?
                     if h_start:
                         next_segments[0].lowercase_form += ")"
-                        next_segments[0].original_case += "L"
                         next_segments[0].elided = True
                     else:
                         segments[-1].lowercase_form += ")"
-                        segments[-1].original_case += "L"
         
         return
 
@@ -546,9 +1175,9 @@ class Verse():
     #  * otherwise -> closed
     def analyse_codas(self):
         # vowel in a syllable whose coda is now analysed
-        # initialized as a sentinel to catch the irrelevant consonant
-        # chunk before the first vowel
-        this_vowel = Segment()
+        # (None before the first vowel: the consonant chunk there
+        # is irrelevant)
+        this_vowel = None
         consonant_count = 0   # number of consonants after this vowel
         chunk = ""   # the consonants themselves
         
@@ -565,13 +1194,15 @@ class Verse():
                     # one or no consonant, or all the consonants belong to
                     # the next word
                     if consonant_count <= 1 or chunk.startswith(" "):
-                        this_vowel.coda = "open"
+                        coda = "open"
                     # muta cum liquida in the middle of the word is
                     # ambivalent
                     elif chunk in MCL:
-                        this_vowel.coda = "unknown"
+                        coda = "unknown"
                     else:
-                        this_vowel.coda = "closed"
+                        coda = "closed"
+                    if this_vowel is not None:
+                        this_vowel.coda = coda
 
                     # now analyse the next syllable
                     this_vowel = segment
@@ -579,10 +1210,11 @@ class Verse():
                     chunk = ""
         
         # analyse the last syllable specially
-        if consonant_count == 0:
-            this_vowel.coda = "open"
-        else:
-            this_vowel.coda = "closed"
+        if this_vowel is not None:
+            if consonant_count == 0:
+                this_vowel.coda = "open"
+            else:
+                this_vowel.coda = "closed"
         
         return
 
@@ -613,7 +1245,7 @@ class Verse():
         for token in self.tokens:
             for segment in token.segments:
                 verse += restore_cases(segment.lowercase_form,
-                                       segment.original_case)
+                                       segment.case_mask)
         print(verse)
 
     # -: long syllable
@@ -662,42 +1294,57 @@ class Verse():
         self.candidate_sequences = candidate_sequences
         return
 
-    # find which of these can be hexameter line
+    # find which of these can be a line of the meter
     def find_metrical_sequences(self):
         metrical_sequences = sorted(
-            self.candidate_sequences.intersection(HEXAMETER.sequences))
+            self.candidate_sequences.intersection(self.meter.sequences))
         full_metrical_sequences = [
             full_sequence for sequence, full_sequence
-            in HEXAMETER.sequences.items()
+            in self.meter.sequences.items()
             if sequence in metrical_sequences
             ]
 
-        # if two sequences differ only in the last element, which is
-        # free in hexameter, merge them together
-        def merge_sequences(sequences):
-            merged_sequences = []
-            i = 0
-            # compare the current sequence with the next
-            while i < len(sequences)-1:
-                this, next_ = sequences[i], sequences[i+1]
-                if len(this) == len(next_) and this[:-1] == next_[:-1]:
-                    merged_sequences.append(this[:-1]+"o")
-                    i += 2
-                else:
-                    merged_sequences.append(this)
-                    i += 1
-            # if the antepenultimate sequence wasn't the same as
-            # the last one, add it (this covers also the case when there
-            # is only one sequence)
-            if i == len(sequences)-1:
-                merged_sequences.append(sequences[-1])
-            return merged_sequences
-        
         self.metrical_sequences = merge_sequences(metrical_sequences)
         self.full_metrical_sequences = merge_sequences(
             full_metrical_sequences)
         return
 
+    # the same as generate_candidate_sequences + find_metrical_sequences,
+    # but the scheme is run through the automaton of the meter directly
+    def match_metrical_sequences(self):
+        key = self.get_scheme_key()
+        result = SCHEME_CACHE.get(key)
+        if result is None:
+            if self.auto_meter:
+                matches = get_meter_group().match(self.scheme)
+                if matches:
+                    meter, sequences = next(iter(matches.items()))
+                else:
+                    meter, sequences = self._meter, {}
+            else:
+                meter, sequences = self._meter, self._meter.match(self.scheme)
+            result = make_match_result(meter, sequences)
+            SCHEME_CACHE.put(key, result)
+        self.set_match_result(result)
+        return
+
+    # results for the same scheme and meter are always the same, this
+    # is their key in SCHEME_CACHE
+    def get_scheme_key(self):
+        return (self.scheme, get_meter_group() if self.auto_meter
+                else self._meter)
+
+    # result of matching (see make_match_result), from
+    # match_metrical_sequences or a batch of verses (see batch.py)
+    def set_match_result(self, result):
+        meter, metrical_sequences, full_metrical_sequences = result
+        self.matching_pending = False
+        self.meter = meter
+        # copies, so that the cached results cannot be changed
+        self.metrical_sequences = list(metrical_sequences)
+        self.full_metrical_sequences = list(full_metrical_sequences)
+        return
+
     def scan(self):
         scansions = []
 
@@ -711,7 +1358,7 @@ class Verse():
             # is there elision? (necessary for correct placement of
             # the feet boundary)
             chunk_elision = False
-            prev_vowel = Segment()   # sentinel
+            prev_vowel = NO_SEGMENT   # sentinel
             
             for token in self.tokens:
                 for segment in token.segments:
@@ -729,6 +1376,8 @@ class Verse():
                                 chunk_sequence = f"{chunk_sequence[:space_id]} | {chunk_sequence[space_id+1:]}"
                             else:
                                 if (
+                                    # the boundary before the first syllable
+                                    prev_vowel is NO_SEGMENT or
                                     prev_vowel.coda == "open" or
                                     (prev_vowel.coda == "unknown" and
                                      (sequence[i-1] == "u" or prev_vowel.length == "long"
@@ -765,9 +1414,9 @@ class Verse():
                             if sequence[i] == "-":
                                 new = ADD_MACRON[new]
                             elif sequence[i] == "u":
-                                new = ADD_BREVE[new]
+                                new = ADD_SHOWN_BREVE[new]
                         
-                        text += restore_cases(new, segment.original_case)
+                        text += restore_cases(new, segment.case_mask)
                         
                         aligned_sequence += sequence[i]
                         # add space in the aligned_sequence if diphthong or nasal
@@ -778,7 +1427,7 @@ class Verse():
                         prev_vowel = segment
                         
                     else:
-                        chunk += restore_cases(segment.lowercase_form, segment.original_case)
+                        chunk += restore_cases(segment.lowercase_form, segment.case_mask)
                         if segment.elided:
                             chunk_elision = True
             
@@ -797,31 +1446,85 @@ class Verse():
         self.scansion_count = len(scansions)-1   # minus the scansion with the scheme
         return
 
+    def scan_result(self):
+        """Returns the results of the scansion as a ScanResult."""
+        if len(self.original_form) < 10:
+            status = "skipped"
+        elif self.scansion_count == 0:
+            status = "unscannable"
+        elif self.scansion_count == 1:
+            status = "unambiguous"
+        else:
+            status = "ambiguous"
+        return ScanResult(self.original_form, self.meter.name, self.scheme,
+                          self.metrical_sequences,
+                          self.full_metrical_sequences,
+                          self.scansions[0], self.scansions[1:], status)
+
     def print_scansions(self):
         """Prints all scansions: text and sequence of syllable lengths
         aligned with vowels. If the verse cannot be scanned, it prints
         the scheme instead."""
-        # skip empty lines or too short lines (probably with verse numebrs)
-        if len(self.original_form) < 10:
-            print(self.original_form)
-            return
-        
-        # if the verse cannot be scanned, print at least the scheme
-        if self.scansion_count == 0:
-            print("WARNING: cannot scan this", file=sys.stderr)
-            print(self.scansions[0][0])
-            print(self.scansions[0][1])
-        elif self.scansion_count == 1:   # one scansion
-            print(self.scansions[1][0])
-            print(self.scansions[1][1])
-        else:    # more than one scansion
-            print("WARNING: cannot scan this unambiguosly", file=sys.stderr)
-            for i, (text, sequence) in enumerate(self.scansions[1:],
-                                                 start=1):
-                print(f"{i}. {text}")
-                print(f"   {sequence}")
-                if i != self.scansion_count:
-                    print()
+        text, warning = format_scansions(self.scan_result())
+        if warning:
+            print(warning, file=sys.stderr)
+        print(text, end="")
         return
 
 
+# results of scanning one line
+#  .line: the line as it was given
+#  .meter: name of the meter
+#  .scheme: "-", "u", "o" for each syllable
+#  .metrical_sequences, .full_metrical_sequences: see Verse
+#  .scheme_scansion: text of the verse and the scheme aligned with vowels
+#  .scansions: text and aligned sequence for each full metrical sequence
+#  .status: "skipped" (too short to be a verse), "unscannable",
+#       "unambiguous" or "ambiguous"
+ScanResult = namedtuple("ScanResult", (
+    "line meter scheme metrical_sequences full_metrical_sequences"
+    " scheme_scansion scansions status").split())
+
+def format_scansions(result):
+    """Returns the text Verse.print_scansions prints for the result,
+    and the warning it prints to stderr (or None)."""
+    # skip empty lines or too short lines (probably with verse numebrs)
+    if result.status == "skipped":
+        return f"{result.line}\n", None
+
+    # if the verse cannot be scanned, print at least the scheme
+    if result.status == "unscannable":
+        text, sequence = result.scheme_scansion
+        return f"{text}\n{sequence}\n", "WARNING: cannot scan this"
+    elif result.status == "unambiguous":   # one scansion
+        text, sequence = result.scansions[0]
+        return f"{text}\n{sequence}\n", None
+    else:    # more than one scansion
+        lines = []
+        for i, (text, sequence) in enumerate(result.scansions, start=1):
+            lines.append(f"{i}. {text}\n")
+            lines.append(f"   {sequence}\n")
+            if i != len(result.scansions):
+                lines.append("\n")
+        return "".join(lines), "WARNING: cannot scan this unambiguosly"
+
+def iter_scans(lines, length_dictionary=None, unmarked_short=False,
+               meter="hexameter", result_cache=None):
+    """Scans the lines one by one, yields a ScanResult for each.
+    meter: see Verse, couplets (see assign_meters) are allowed too.
+    result_cache: result_cache.ResultCache to take the results from
+    (where it has them)."""
+    pairs = assign_meters(lines, meter)
+    if result_cache is not None:
+        yield from result_cache.scan_pairs(pairs, length_dictionary,
+                                           unmarked_short)
+        return
+    for line, line_meter in pairs:
+        yield scan_line(line, length_dictionary, unmarked_short, line_meter)
+
+def scan_line(line, length_dictionary=None, unmarked_short=False,
+              meter="hexameter"):
+    """Scans one line, returns a ScanResult."""
+    verse = Verse(line, length_dictionary=length_dictionary,
+                  unmarked_short=unmarked_short, meter=meter)
+    return verse.scan_result()
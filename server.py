@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import json
+import time
+import argparse
+import threading
+import traceback
+import multiprocessing
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+from scan import (METERS, COUPLETS, SCHEME_CACHE, ScanResult,
+                  assign_meters, scan_line)
+from lengths import DEFAULT_LENGTH_DICTIONARY, open_length_dictionary
+from result_cache import DEFAULT_MAX_ENTRIES, ResultCache
+from profiling import percentile
+
+LATENCY_COUNT = 10000   # latencies kept for the statistics of each endpoint
+
+
+# scanning in worker processes
+# ----------------------------
+
+# length dictionary of a worker process (each worker loads it once
+# when it starts)
+_worker_length_dictionary = None
+
+def init_worker(dictionary_path, cache_size):
+    global _worker_length_dictionary
+    SCHEME_CACHE.resize(cache_size)
+    if dictionary_path is None:
+        _worker_length_dictionary = None
+    else:
+        _worker_length_dictionary = open_length_dictionary(dictionary_path)
+
+def scan_pairs(pairs, length_dictionary, unmarked_short):
+    """Returns the results of (line, meter) pairs as dicts (see
+    ScanResult)."""
+    return [scan_line(line, length_dictionary, unmarked_short,
+                      meter)._asdict()
+            for line, meter in pairs]
+
+def scan_chunk(task):
+    pairs, unmarked_short, nolengths = task
+    return scan_pairs(pairs, None if nolengths else _worker_length_dictionary,
+                      unmarked_short)
+
+
+class ScanService():
+    """Class scanning lines with the length dictionary loaded once,
+    either in this process (jobs=0) or in a pool of worker processes,
+    and keeping statistics of the requests. With result_cache_path,
+    results are taken from a ResultCache where it has them."""
+
+    def __init__(self, dictionary_path=DEFAULT_LENGTH_DICTIONARY, jobs=0,
+                 cache_size=SCHEME_CACHE.maxsize, chunk_size=200,
+                 result_cache_path=None,
+                 result_cache_size=DEFAULT_MAX_ENTRIES):
+        if dictionary_path is not None and not os.path.exists(
+                dictionary_path):
+            raise FileNotFoundError(dictionary_path)
+        self.dictionary_path = dictionary_path
+        self.jobs = jobs
+        self.chunk_size = chunk_size
+        self.start_time = time.time()
+        self.pool = None
+        self.length_dictionary = None
+        self.scan_lock = threading.Lock()   # the caches are not thread-safe
+        if jobs:
+            self.pool = multiprocessing.Pool(
+                jobs, initializer=init_worker,
+                initargs=(dictionary_path, cache_size))
+        else:
+            SCHEME_CACHE.resize(cache_size)
+        # with workers, only for the fingerprint of the result cache
+        if dictionary_path is not None and (not jobs or result_cache_path):
+            self.length_dictionary = open_length_dictionary(dictionary_path)
+        self.result_cache = None
+        self.result_cache_lock = threading.Lock()
+        if result_cache_path is not None:
+            self.result_cache = ResultCache(result_cache_path,
+                                            result_cache_size)
+        self.statistics_lock = threading.Lock()
+        self.latencies = {}   # endpoint -> deque of seconds
+        self.request_counts = {}   # endpoint -> number of requests
+        self.error_count = 0
+        self.line_count = 0
+
+    def scan(self, lines, meter="hexameter", unmarked_short=False,
+             nolengths=False):
+        """Returns the results of the lines as dicts (see ScanResult).
+        meter: name of a registered meter, "auto" or couplets (schemes
+        are not accepted, compiling them can take long)."""
+        if meter != "auto" and meter not in COUPLETS and meter not in METERS:
+            raise ValueError(f"Unknown meter: {meter!r} (expected one of"
+                             f" {', '.join(['auto', *METERS, *COUPLETS])})")
+        pairs = list(assign_meters(lines, meter))
+        length_dictionary = None if nolengths else self.length_dictionary
+
+        def scan_missing(pairs):
+            return [ScanResult(**result) for result in self.scan_pairs(
+                pairs, length_dictionary, unmarked_short, nolengths)]
+
+        if self.result_cache is None:
+            results = self.scan_pairs(pairs, length_dictionary,
+                                      unmarked_short, nolengths)
+        else:
+            with self.result_cache_lock:
+                results = [result._asdict() for result
+                           in self.result_cache.scan_pairs(
+                               pairs, length_dictionary, unmarked_short,
+                               scan_missing)]
+        with self.statistics_lock:
+            self.line_count += len(results)
+        return results
+
+    def scan_pairs(self, pairs, length_dictionary, unmarked_short,
+                   nolengths):
+        """Returns the results of (line, meter) pairs as dicts, scanned
+        in this process or by the workers."""
+        if self.pool is None:
+            with self.scan_lock:
+                return scan_pairs(pairs, length_dictionary, unmarked_short)
+        tasks = [(pairs[i:i+self.chunk_size], unmarked_short, nolengths)
+                 for i in range(0, len(pairs), self.chunk_size)]
+        return [result for chunk_results in self.pool.map(scan_chunk, tasks)
+                for result in chunk_results]
+
+    def record(self, endpoint, seconds, error=False):
+        """Adds the latency of a request."""
+        with self.statistics_lock:
+            if endpoint not in self.latencies:
+                self.latencies[endpoint] = deque(maxlen=LATENCY_COUNT)
+                self.request_counts[endpoint] = 0
+            self.latencies[endpoint].append(seconds)
+            self.request_counts[endpoint] += 1
+            if error:
+                self.error_count += 1
+
+    def health(self):
+        return {
+            "status": "ok",
+            "uptime_s": round(time.time()-self.start_time, 1),
+            "dictionary": self.dictionary_path,
+            "jobs": self.jobs,
+            }
+
+    def statistics(self):
+        """Returns the numbers of requests and percentiles of their
+        latencies (in milliseconds, of the last LATENCY_COUNT requests
+        of each endpoint)."""
+        with self.statistics_lock:
+            endpoints = {}
+            for endpoint, latencies in self.latencies.items():
+                latencies = sorted(latencies)
+                endpoints[endpoint] = {
+                    "requests": self.request_counts[endpoint],
+                    "mean_ms": round(sum(latencies)*1000/len(latencies), 3),
+                    "p50_ms": round(percentile(latencies, 0.5)*1000, 3),
+                    "p90_ms": round(percentile(latencies, 0.9)*1000, 3),
+                    "p99_ms": round(percentile(latencies, 0.99)*1000, 3),
+                    "max_ms": round(latencies[-1]*1000, 3),
+                    }
+            return {
+                "lines": self.line_count,
+                "errors": self.error_count,
+                "endpoints": endpoints,
+                }
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+        if self.result_cache is not None:
+            self.result_cache.close()
+        return
+
+
+# HTTP
+# ----
+
+class RequestError(Exception):
+    """Bad request, reported with the status 400."""
+
+
+def get_options(options):
+    """Returns the scanning options (meter, unmarked_short, nolengths)
+    of a request (JSON body or query parameters)."""
+    def flag(name):
+        value = options.get(name, False)
+        if isinstance(value, str):
+            return value.lower() in ("1", "true", "yes")
+        return bool(value)
+    meter = options.get("meter", "hexameter")
+    if not isinstance(meter, str):
+        raise RequestError("meter must be a string")
+    return meter, flag("brevize"), flag("nolengths")
+
+
+class ScanRequestHandler(BaseHTTPRequestHandler):
+    """Endpoints:
+    GET /health
+    GET /stats: latency statistics (see ScanService.statistics)
+    GET /scan?line=...[&meter=...&brevize=1&nolengths=1]
+    POST /scan {"line": "...", "meter": ..., "brevize": ...,
+                "nolengths": ...}: the result of the line (see ScanResult)
+    POST /batch {"lines": [...], ...}: {"results": [...]}"""
+
+    server_version = "Semetrika"
+    protocol_version = "HTTP/1.1"   # keep-alive
+    # headers and body are written separately, which would wait for
+    # delayed ACKs on a kept-alive connection
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, content):
+        body = json.dumps(content, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        # the body is not read then, so the connection cannot be reused
+        if length < 0:
+            self.close_connection = True
+            raise RequestError("invalid Content-Length")
+        if length > self.server.max_body_size:
+            self.close_connection = True
+            raise RequestError("request too large")
+        try:
+            content = json.loads(self.rfile.read(length).decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError) as error:
+            raise RequestError(f"invalid JSON: {error}")
+        if not isinstance(content, dict):
+            raise RequestError("expected a JSON object")
+        return content
+
+    def handle_request(self, method):
+        start = time.perf_counter()
+        url = urlsplit(self.path)
+        endpoint = f"{method} {url.path}"
+        service = self.server.service
+        status = 200
+        try:
+            if method == "GET" and url.path == "/health":
+                content = service.health()
+            elif method == "GET" and url.path == "/stats":
+                content = service.statistics()
+            elif url.path == "/scan" and method in ("GET", "POST"):
+                if method == "GET":
+                    options = {name: values[-1] for name, values
+                               in parse_qs(url.query).items()}
+                else:
+                    options = self.read_json()
+                line = options.get("line")
+                if not isinstance(line, str):
+                    raise RequestError("line must be a string")
+                content = service.scan([line], *get_options(options))[0]
+            elif method == "POST" and url.path == "/batch":
+                options = self.read_json()
+                lines = options.get("lines")
+                if (not isinstance(lines, list) or
+                    not all(isinstance(line, str) for line in lines)):
+                    raise RequestError("lines must be a list of strings")
+                if len(lines) > self.server.max_batch_size:
+                    raise RequestError("too many lines, at most"
+                                       f" {self.server.max_batch_size}")
+                content = {"results": service.scan(lines,
+                                                   *get_options(options))}
+            else:
+                endpoint = None   # unknown endpoints are not recorded
+                status, content = 404, {"error": "not found"}
+        except (RequestError, ValueError) as error:
+            status, content = 400, {"error": str(error)}
+        except Exception:
+            # a bug, not a bad request: logged even without --verbose
+            traceback.print_exc()
+            status, content = 500, {"error": "internal server error"}
+        self.send_json(status, content)
+        if endpoint is not None:
+            service.record(endpoint, time.perf_counter()-start,
+                           error=status != 200)
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+
+def make_server(service, host="127.0.0.1", port=8000, max_batch_size=10000,
+                max_body_size=10_000_000, verbose=False):
+    """Returns a (not yet serving) HTTP server of the service; port 0
+    means any free port (see server.server_address)."""
+    server = ThreadingHTTPServer((host, port), ScanRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.max_batch_size = max_batch_size
+    server.max_body_size = max_body_size
+    server.verbose = verbose
+    return server
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(
+        description="HTTP service scanning verses with the length"
+                    " dictionary loaded once.")
+    argparser.add_argument("--host",
+                           help="address to listen on (default: 127.0.0.1)",
+                           default="127.0.0.1")
+    argparser.add_argument("-p", "--port",
+                           help="port to listen on (default: 8000, 0: any)",
+                           type=int, default=8000)
+    argparser.add_argument("-d", "--dictionary",
+                           help=("length dictionary, binary or pickled;"
+                                 f" default: {DEFAULT_LENGTH_DICTIONARY}"),
+                           default=DEFAULT_LENGTH_DICTIONARY)
+    argparser.add_argument("-j", "--jobs",
+                           help=("number of worker processes (default: 0,"
+                                 " i. e. scan in the server process)"),
+                           type=int, default=0)
+    argparser.add_argument("--chunk-size",
+                           help=("number of lines of a batch sent to"
+                                 " a worker at once (default: 200)"),
+                           type=int, default=200)
+    argparser.add_argument("--cache-size",
+                           help=("maximal number of cached verse schemes;"
+                                 f" default: {SCHEME_CACHE.maxsize}"),
+                           type=int, default=SCHEME_CACHE.maxsize)
+    argparser.add_argument("--result-cache",
+                           help=("SQLite database of results to take them"
+                                 " from when the same lines are scanned"
+                                 " again (see app.py --result-cache)"),
+                           metavar="PATH")
+    argparser.add_argument("--result-cache-size",
+                           help=("maximal number of results in the result"
+                                 f" cache; default: {DEFAULT_MAX_ENTRIES}"),
+                           type=int, default=DEFAULT_MAX_ENTRIES,
+                           metavar="N")
+    argparser.add_argument("--max-batch",
+                           help=("maximal number of lines in a batch"
+                                 " (default: 10000)"),
+                           type=int, default=10000)
+    argparser.add_argument("-v", "--verbose",
+                           help="log each request to stderr",
+                           action="store_true")
+    args = argparser.parse_args()
+    if args.jobs < 0:
+        argparser.error("--jobs cannot be negative")
+    if args.chunk_size < 1:
+        argparser.error("--chunk-size must be at least 1")
+
+    dictionary_path = args.dictionary
+    if not os.path.exists(dictionary_path):
+        print("WARNING: length dictionary not found, cannot add lengths",
+              file=sys.stderr)
+        dictionary_path = None
+    service = ScanService(dictionary_path, args.jobs, args.cache_size,
+                          args.chunk_size, args.result_cache,
+                          args.result_cache_size)
+    server = make_server(service, args.host, args.port, args.max_batch,
+                         verbose=args.verbose)
+    host, port = server.server_address[:2]
+    print(f"listening on http://{host}:{port}/", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import contextlib
 from collections import Counter
 
 from lengths import *
@@ -69,16 +70,246 @@ class Test():
         are scanned differently without and with length dictionary."""
         for verse_wo, verse_with in zip(self.verses_without_lengths,
                                         self.verses_with_lengths):
-            if verse_wo.scansion_count == 0:
-                print("NO SCANSION FOUND:")
-                verse_wo.print_scansions()
-                print(f"\n{'='*30}\n")
-            elif verse_wo.scansion_count != verse_with.scansion_count:
-                print("DIFFERENT NUMEBR OF SCANSIONS:")
-                print("WITHOUT LENGTH DICTIONARY:")
-                verse_wo.print_scansions()
-                print("WITH LENGTH DICTIONARY:", end=" ")
-                verse_with.print_verse()
-                verse_with.print_scansions()
-                print(f"\n{'='*30}\n")
+            print_difference(verse_wo, verse_with)
         return
+
+
+def print_difference(verse_wo, verse_with):
+    """Prints the verse if it cannot be scanned or if it is scanned
+    differently without and with length dictionary."""
+    if verse_wo.scansion_count == 0:
+        print("NO SCANSION FOUND:")
+        verse_wo.print_scansions()
+        print(f"\n{'='*30}\n")
+    elif verse_wo.scansion_count != verse_with.scansion_count:
+        print("DIFFERENT NUMEBR OF SCANSIONS:")
+        print("WITHOUT LENGTH DICTIONARY:")
+        verse_wo.print_scansions()
+        print("WITH LENGTH DICTIONARY:", end=" ")
+        verse_with.print_verse()
+        verse_with.print_scansions()
+        print(f"\n{'='*30}\n")
+    return
+
+def scan_without_and_with(line, length_dictionary):
+    """Returns the verse scanned without and with the length dictionary;
+    the stages before adding lengths are done only once."""
+    verse_wo = Verse(line)
+    return verse_wo, verse_wo.fork(length_dictionary=length_dictionary)
+
+
+class StreamingTest():
+    """Class for testing Semetrika with and without using length
+    dictionary like Test, but the lines are scanned one at a time and
+    only the statistics are kept, so that memory does not grow with
+    the number of lines. Verses which cannot be scanned or are scanned
+    differently are printed to the differences file (if given) right
+    away."""
+
+    def __init__(self, length_dictionary=None, differences=None):
+        self.length_dictionary = (default_ld.dictionary
+                                  if length_dictionary is None
+                                  else length_dictionary)
+        self.differences = differences
+        self.verse_count = 0
+        self.no_scansion_count = 0
+        self.different_count = 0
+        self.statistics = {"without": Counter(), "with": Counter()}
+
+    def add_lines(self, lines):
+        for line in lines:
+            self.add_line(line)
+        return
+
+    def add_line(self, line):
+        # skip short lines
+        if len(line) <= 10:
+            return
+        verse_wo, verse_with = scan_without_and_with(line,
+                                                     self.length_dictionary)
+        self.verse_count += 1
+        self.statistics["without"][verse_wo.scansion_count] += 1
+        self.statistics["with"][verse_with.scansion_count] += 1
+        if verse_wo.scansion_count == 0:
+            self.no_scansion_count += 1
+        elif verse_wo.scansion_count != verse_with.scansion_count:
+            self.different_count += 1
+        else:
+            return
+        if self.differences is not None:
+            with contextlib.redirect_stdout(self.differences):
+                print_difference(verse_wo, verse_with)
+        return
+
+    print_statistics = Test.print_statistics
+
+# the hexameter with feet boundaries also before the first and after
+# the last foot, which the automaton has to output as Meter.sequences does
+BOUNDED_HEXAMETER = "| -w | -w | -w | -w | -uu | -o |"
+
+def compare_matchers(lines, length_dictionary=None,
+                     meters=("hexameter", BOUNDED_HEXAMETER)):
+    """Returns lines for which matching the scheme with the automaton of
+    any of the meters gives different results than enumerating all
+    candidate sequences (the reference implementation)."""
+    different = []
+    for line in lines:
+        for meter in meters:
+            automaton = Verse(line, length_dictionary=length_dictionary,
+                              meter=meter)
+            reference = Verse(line, length_dictionary=length_dictionary,
+                              meter=meter, enumerate_candidates=True)
+            if (
+                automaton.metrical_sequences !=
+                reference.metrical_sequences or
+                automaton.full_metrical_sequences !=
+                reference.full_metrical_sequences
+            ):
+                different.append(line)
+                break
+    return different
+
+
+# the same as Token.segmentize, character by character (the reference
+# implementation of SEGMENTER)
+def segmentize_reference(token):
+    segments = []
+    # parse non-word segments (punctuation, numbers) as one segment
+    if token.type_ != "word":   
+        segments.append(Segment(token.lowercase_form,
+                                token.case_mask, "other"))
+    # for word segments:
+    else:
+        # to avoid checking whether we are at the beginning or
+        # the end of the word, add sentinel spaces
+        form = f" {token.lowercase_form} "
+        i = 1   # id of the current character in the token
+        while form[i] != " ":
+            prev, char, next_ = form[i-1:i+2]
+            new_i = i+1
+
+            # diphthongs
+            if (
+                (char+next_ in DIPHTHONGS) or
+                (char+next_ == "eu" and form[1:-1] in EU_WORDS) or
+                (char+next_ == "ui" and form[1:-1] in UI_WORDS)
+            ):
+                new = [Segment(char+next_, 0,
+                               "vowel", subtype = "diphthong")]
+                new_i += 1
+
+            # final nasal vowels
+            elif char in VOWELS and form[i+1:] == "m ":
+                new = [Segment(char+next_, 0,
+                               "vowel", subtype = "nasal")]
+                new_i += 1
+
+            # i as a consonant
+            # before a vowel initially or after a prefix 
+            elif (
+                char == "i" and next_ in VOWELS and
+                (i == 1 or form[1:i] in PREFIXES)
+            ):   
+                new = [Segment("i", 0, "consonant")]
+            # i as two consonants between two vowels
+            elif (
+                (char == "i" or char == "j") and
+                prev in VOWELS and next_ in VOWELS and
+                form[i-2:i] != "qu" and form[i-3:i] != "ngu"
+                # qu, (n)gu is a consonant, not a vowel
+            ):   
+                new = [Segment("", 0, "consonant"),
+                       Segment(char, 0, "consonant")]
+            # otherwise i is a monophthong and is treated later
+
+            # qu is a single consonant
+            elif char+next_ == "qu":
+                new = [Segment("qu", 0,
+                               "consonant")]
+                new_i += 1
+            # gu after n and before a vowel is a single consonant
+            elif prev+char+next_ == "ngu" and form[i+2] in VOWELS:
+                new = [Segment("gu", 0,
+                               "consonant")]
+                new_i += 1
+
+            # x (= cs), z (= zz) are two consonants
+            elif char == "x" or char == "z":
+                new = [Segment("", 0, "consonant"),
+                       Segment(char, 0, "consonant")]
+
+            # h never causes length by position and does not
+            # prevent elision, so it gets a special type
+            elif char == "h":
+                new = [Segment("h", 0, "h")]
+            
+            # y with breve: there is no single character for it in
+            # Unicode, so it was not normalized, and has to be
+            # treated specially
+            elif char+next_ == "y̆":
+                new = [Segment("y̆", 0,
+                               "vowel", subtype="monophthong",
+                               length="short")]
+                new_i += 1
+
+            # other vowels
+            elif char in VOWELS:
+                if char in VOWELS_LONG:
+                    length = "long"
+                elif char in VOWELS_SHORT:
+                    length = "short"
+                else:
+                    length = "unknown"
+                new = [Segment(char, 0, "vowel",
+                               subtype="monophthong",
+                               length=length)]
+
+            # other consonants
+            elif char in CONSONANTS:
+                new = [Segment(char, 0, "consonant")]
+
+            else:
+                raise ValueError("Cannot analyse this character:"
+                                 + f" {char!r}")
+
+            segments.extend(new)
+            i = new_i
+
+        # each segment spans as many characters as its form has
+        if token.case_mask:
+            i = 0
+            for segment in segments:
+                span = len(segment.lowercase_form)
+                segment.case_mask = (token.case_mask >> i) & ((1 << span)-1)
+                i += span
+
+    token.segments = segments
+    return
+
+
+def compare_segmenters(lines):
+    """Returns word forms (from the lines) for which Token.segmentize
+    gives different segments than segmentize_reference."""
+    def segment_properties(token, segmentize):
+        try:
+            segmentize(token)
+        except ValueError as error:
+            return str(error)
+        return [(segment.lowercase_form, segment.case_mask, segment.type_,
+                 segment.subtype, segment.length)
+                for segment in token.segments]
+
+    different = []
+    seen = set()
+    for line in lines:
+        verse = Verse(line, idle=True)
+        verse.normalize()
+        verse.tokenize()
+        for token in verse.tokens:
+            if token.type_ != "word" or token.original_form in seen:
+                continue
+            seen.add(token.original_form)
+            if (segment_properties(token, Token.segmentize) !=
+                segment_properties(token, segmentize_reference)):
+                different.append(token.original_form)
+    return different